@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# asyncio Gothello client. AsyncGthClient speaks the same protocol as
+# gthclient.GthClient, sharing its message handling and errors, but
+# reads and writes through asyncio streams so one process can keep
+# many games open at once.
+#
+# Running this file plays several games against a server at the same
+# time. The searches run in a process pool so they never block the
+# event loop; every worker keeps its own transposition table for all
+# the games it searches.
+
+import argparse
+import asyncio
+import concurrent.futures
+import time
+
+import gthclient
+import parallel
+import search
+from board import PASS, move_to_str, str_to_move
+
+class AsyncGthClient(gthclient.GthProtocol):
+    """
+    Gothello client for asyncio. Create one with
+    connect().
+    """
+
+    def __init__(self, side, reader, writer):
+        """
+        Wrap the streams of an open connection. Use
+        connect() to also do the handshake.
+        """
+
+        gthclient.GthProtocol.__init__(self, side)
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, side, host, server):
+        """
+        Give a side ("white" or "black"), the hostname
+        of the server, and the "server-number" of that
+        server, connect a new Gothello client. Returns
+        once the opponent has joined.
+        """
+
+        reader, writer = await asyncio.open_connection(
+            host, gthclient.server_base + server)
+        client = cls(side, reader, writer)
+        try:
+            await client.send(client.check_greeting(*await client.get_msg()))
+            client.check_side(*await client.get_msg())
+            client.check_opponent(*await client.get_msg())
+        except Exception:
+            client.closeall()
+            raise
+        return client
+
+    async def get_msg(self):
+        """
+        Get a message from the server. Ignores blank lines.
+        Returns a tuple of the decoded message code and the
+        rest of the message text.
+        """
+
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise gthclient.MoveError(
+                    gthclient.MoveError.DISCO,
+                    "disconnected",
+                )
+            msg = self.parse_msg(line.decode("utf_8"))
+            if msg is not None:
+                return msg
+
+    def closeall(self):
+        """
+        Close the connection to the server.
+        """
+
+        self.writer.close()
+
+    async def send(self, msg_text):
+        """
+        Send a line to the server.
+        """
+
+        self.writer.write((msg_text + "\r\n").encode("utf_8"))
+        await self.writer.drain()
+
+    async def make_move(self, pos):
+        """
+        Given a position string in standard format or
+        "pass", send to the server.
+        """
+
+        await self.send(self.move_line(pos))
+        if not self.move_ack(*await self.get_msg()):
+            self.closeall()
+            return False
+        self.move_status(*await self.get_msg())
+        return True
+
+    async def get_move(self):
+        """
+        Get an opponent move from the server. Returns
+        a tuple: a boolean that is False when the
+        game is over, and the actual move string.
+        """
+
+        self.check_game_on("read move with game over")
+        return self.opp_move(*await self.get_msg())
+
+# Searches position in a worker process set up by parallel.init_worker.
+# Returns the move and the nodes searched.
+def search_position(position, options, depth, budget):
+    parallel.worker.set_options(options)
+    if budget is None:
+        move = parallel.worker.iterate(position, depth)
+    else:
+        move = parallel.worker.iterate(position, search.MAX_DEPTH, budget)
+    if move is None:
+        move = PASS
+    return move, parallel.worker.nodes
+
+# Plays one game as side, searching in executor. Returns the winner.
+async def play_game(n, side, host, server, executor, depth, engine, options):
+    client = await AsyncGthClient.connect(side, host, server)
+    loop = asyncio.get_running_loop()
+    board = search.ENGINES[engine]()
+    mine = side == "black"
+    while True:
+        if mine:
+            budget = None
+            if client.my_time is not None:
+                budget = search.move_budget(client.my_time, board.empty_count())
+            move, nodes = await loop.run_in_executor(
+                executor, search_position, board, options, depth, budget)
+            board.try_move(move)
+            print("game {} me: {} nodes: {}".format(n, move_to_str(move), nodes))
+            if not await client.make_move(move_to_str(move)):
+                break
+        else:
+            cont, move = await client.get_move()
+            if not cont:
+                client.closeall()
+                break
+            board.try_move(str_to_move(move))
+        mine = not mine
+    if client.winner == "draw":
+        print("game {}: draw".format(n))
+    else:
+        print("game {}: {} wins".format(n, client.winner))
+    return client.winner
+
+async def play_games(args):
+    executor = concurrent.futures.ProcessPoolExecutor(
+        args.workers,
+        initializer=parallel.init_worker,
+        initargs=(args.hash,),
+    )
+    options = {"symmetry": args.symmetry}
+    start = time.time()
+    try:
+        games = [play_game(n, args.color, args.server_name, args.server_number,
+                           executor, args.depth, args.engine, options)
+                 for n in range(args.games)]
+        winners = await asyncio.gather(*games, return_exceptions=True)
+    finally:
+        executor.shutdown(cancel_futures=True)
+    elapsed = time.time() - start
+    wins = sum(1 for w in winners if w == args.color)
+    errors = [w for w in winners if isinstance(w, Exception)]
+    for error in errors:
+        print("error:", getattr(error, "message", error))
+    print("games: {} wins: {} errors: {} in {:.1f}s".format(
+        len(winners), wins, len(errors), elapsed))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play many Gothello games at once from one process.")
+    parser.add_argument("color", choices=["black", "white"])
+    parser.add_argument("server_name")
+    parser.add_argument("server_number", type=int)
+    parser.add_argument("depth", type=int)
+    parser.add_argument("--games", type=int, default=8,
+                        help="games played at the same time")
+    parser.add_argument("--engine", choices=sorted(search.ENGINES),
+                        default="bitboard")
+    parser.add_argument("--hash", type=int, default=16, metavar="MB",
+                        help="transposition table size of each worker")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="search processes, one per core by default")
+    parser.add_argument("--symmetry", action="store_true")
+    asyncio.run(play_games(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
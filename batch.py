@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+# Batched move generation and evaluation with NumPy for analysis and
+# self-play data. Positions are an (N, 5, 5) int8 array holding the
+# Board values 0 (empty), PLAYER_BLACK and PLAYER_WHITE, and to_move is
+# either one player for every position or an (N,) array. Internally
+# each color becomes a 25 bit mask per position, laid out like
+# bitboard.BitBoard, and the flood fills run on all positions at once.
+#
+# Running this file cross-checks the batched functions against the
+# scalar Board on positions from random games.
+
+import argparse
+import copy
+import random
+
+import numpy as np
+
+import board
+import bitboard
+from board import PLAYER_BLACK, PLAYER_WHITE, PASS
+
+WEIGHTS = np.left_shift(np.int64(1), np.arange(25, dtype=np.int64))
+POINTS = np.arange(25, dtype=np.int64)
+
+def expand(bits):
+    return (((bits << 1) & bitboard.NOT_COL_0) |
+            ((bits >> 1) & bitboard.NOT_COL_4) |
+            (bits << 5) | (bits >> 5)) & bitboard.FULL
+
+# Grows every seed into the connected stones of own it touches.
+def flood(seed, own):
+    group = seed & own
+    while True:
+        grown = (group | expand(group)) & own
+        if np.array_equal(grown, group):
+            return group
+        group = grown
+
+# Turns (N, 5, 5) positions into black and white masks.
+def to_bits(positions):
+    flat = positions.reshape(len(positions), 25)
+    black = ((flat == PLAYER_BLACK) * WEIGHTS).sum(axis=1)
+    white = ((flat == PLAYER_WHITE) * WEIGHTS).sum(axis=1)
+    return black, white
+
+# Turns black and white masks back into (N, 5, 5) positions.
+def from_bits(black, white):
+    black = (black[:, None] >> POINTS) & 1
+    white = (white[:, None] >> POINTS) & 1
+    flat = black * PLAYER_BLACK + white * PLAYER_WHITE
+    return flat.astype(np.int8).reshape(len(flat), 5, 5)
+
+# Masks of the side to move and its opponent.
+def sides(positions, to_move):
+    black, white = to_bits(positions)
+    to_move = np.broadcast_to(np.asarray(to_move), black.shape)
+    own = np.where(to_move == PLAYER_BLACK, black, white)
+    opp = np.where(to_move == PLAYER_BLACK, white, black)
+    return own, opp, to_move
+
+# Returns an (N, 5, 5) bool array of the legal moves, the same moves as
+# Board.genMoves.
+def legal_moves(positions, to_move):
+    own, opp, _ = sides(positions, to_move)
+    empty = bitboard.FULL & ~(own | opp)
+    seeds = WEIGHTS[None, :]
+    own = own[:, None] | seeds
+    empty = empty[:, None]
+    group = flood(np.broadcast_to(seeds, own.shape), own)
+    legal = (empty & seeds != 0) & (expand(group) & empty & ~seeds != 0)
+    return legal.reshape(len(positions), 5, 5)
+
+# Plays one move on every position. move is a single (row, column) or
+# an (N, 2) array, and every move must be legal. A PASS leaves its
+# position as it is. Returns the new positions and an (N, 5, 5) bool
+# array of the captured stones, the same results as Board.make_move.
+def apply_moves(positions, to_move, move):
+    own, opp, to_move = sides(positions, to_move)
+    move = np.broadcast_to(np.asarray(move, dtype=np.int64), (len(positions), 2))
+    point = move[:, 0] * 5 + move[:, 1]
+    stone = np.where(point >= 0, np.left_shift(np.int64(1), np.maximum(point, 0)), 0)
+    own = own | stone
+    empty = bitboard.FULL & ~(own | opp)
+    neighbors = expand(stone) & opp
+    captured = np.zeros_like(own)
+    for point in range(25):
+        seed = neighbors & WEIGHTS[point]
+        if not seed.any():
+            continue
+        group = flood(seed, opp)
+        dead = (seed != 0) & (expand(group) & empty == 0)
+        captured |= np.where(dead, group, 0)
+    own = own | captured
+    opp = opp & ~captured
+    black = np.where(to_move == PLAYER_BLACK, own, opp)
+    white = np.where(to_move == PLAYER_BLACK, opp, own)
+    captured = ((captured[:, None] >> POINTS) & 1).astype(bool)
+    return from_bits(black, white), captured.reshape(len(positions), 5, 5)
+
+# Stones of the side to move minus stones of its opponent, the same
+# value as Board.heval.
+def evaluate(positions, to_move):
+    flat = positions.reshape(len(positions), 25)
+    to_move = np.broadcast_to(np.asarray(to_move), (len(positions),))
+    opponent = np.where(to_move == PLAYER_BLACK, PLAYER_WHITE, PLAYER_BLACK)
+    own = (flat == to_move[:, None]).sum(axis=1)
+    opp = (flat == opponent[:, None]).sum(axis=1)
+    return own - opp
+
+# Packs boards into a positions array and a to_move array.
+def from_boards(boards):
+    positions = np.array([b.grid for b in boards], dtype=np.int8)
+    to_move = np.array([b.to_move for b in boards], dtype=np.int8)
+    return positions, to_move
+
+# Compares every batched result with the scalar Board on positions from
+# random games played with seed. Returns the number of positions and of
+# mismatches.
+def crosscheck(games, seed = None):
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(games):
+        b = board.Board()
+        while True:
+            moves = b.genMoves()
+            if not moves:
+                break
+            boards.append(copy.deepcopy(b))
+            b.try_move(rng.choice(moves))
+    positions, to_move = from_boards(boards)
+    legal = legal_moves(positions, to_move)
+    values = evaluate(positions, to_move)
+    errors = 0
+    for n, b in enumerate(boards):
+        moves = [tuple(m) for m in np.argwhere(legal[n])]
+        if moves != b.genMoves():
+            errors += 1
+        if values[n] != b.heval():
+            errors += 1
+    # Play one random legal move or a pass on every position at once.
+    moves = [rng.choice(b.genMoves() + [PASS]) for b in boards]
+    after, captured = apply_moves(positions, to_move, moves)
+    for n, b in enumerate(boards):
+        before = [row[:] for row in b.grid]
+        b.make_move(moves[n])
+        flipped = [[before[i][j] != b.grid[i][j] and before[i][j] != 0
+                    for j in range(5)] for i in range(5)]
+        if after[n].tolist() != b.grid or captured[n].tolist() != flipped:
+            errors += 1
+    return len(boards), errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-check batched and scalar boards.")
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    positions, errors = crosscheck(args.games, args.seed)
+    print("positions: {} mismatches: {}".format(positions, errors))
+    if errors:
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Benchmarks for the board and search code. A fixed set of positions is
+# run through perft, which counts the move sequences of a given length
+# and checks move generation and make/unmake, and through fixed depth
+# searches, which count nodes and table hits and time them. Results
+# are plain dicts that can be saved as JSON and compared with a stored
+# baseline, so a change to the engine shows up as numbers.
+#
+# Run it with python3 -m bench.
+
+import os
+import random
+import time
+
+import search
+import table
+from board import PASS, GAME_OVER, str_to_move
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Named positions, each given as the moves played from the empty board
+# in server notation.
+POSITIONS = [
+    ("empty", ""),
+    ("opening", "c3 b3 c2"),
+    ("center", "c3 c2 b3 d3 c4 b2"),
+    ("edges", "a1 e5 a5 e1 c3 b2 d4"),
+    ("capture", "b2 a2 c3 b1 a3 a1 d2 b3"),
+    ("middle", "c3 b3 c2 d3 b2 c4 d2 b4 e3 a3"),
+    ("crowded", "c3 b3 c2 d3 b2 c4 d2 b4 e3 a3 a2 d4 e2 c1 b1 e4"),
+]
+
+# Builds a board of the engine class with the moves of a position.
+def make_board(engine, moves):
+    board = search.ENGINES[engine]()
+    for text in moves.split():
+        board.try_move(str_to_move(text))
+    return board
+
+# Number of move sequences of depth plies from board. A side without
+# moves passes and two passes end the game.
+def perft(board, depth):
+    if depth == 0:
+        return 1
+    moves = board.genMoves() or [PASS]
+    count = 0
+    for move in moves:
+        status = board.try_move(move)
+        if status == GAME_OVER:
+            count += 1
+            continue
+        count += perft(board, depth - 1)
+        board.unmake_move()
+    return count
+
+def run_perft(engine, depth):
+    results = {}
+    for name, moves in POSITIONS:
+        board = make_board(engine, moves)
+        start = time.time()
+        nodes = perft(board, depth)
+        elapsed = time.time() - start
+        results[name] = {"nodes": nodes, "time": elapsed}
+    return results
+
+# Fixed depth iterative deepening with a fresh table and search state
+# for every position.
+def run_search(engine, depth, hash_mb, symmetric = False, kind = "negamax",
+               quiescence = 0):
+    results = {}
+    for name, moves in POSITIONS:
+        random.seed(0)
+        board = make_board(engine, moves)
+        state = search.Search(table.Table(hash_mb))
+        state.symmetry = symmetric
+        state.pvs = kind == "pvs"
+        state.quiescence = quiescence
+        state.iterate(board, depth)
+        stats = state.stats
+        results[name] = {
+            "nodes": stats.nodes,
+            "qnodes": stats.qnodes,
+            "tt_probes": stats.tt_probes,
+            "tt_hits": stats.tt_hits,
+            "cutoffs": stats.cutoffs,
+            "researches": stats.researches,
+            "branching_factor": stats.branching_factor(),
+            "value": stats.value,
+            "move": list(stats.move),
+            "time": stats.time,
+        }
+    return results
+
+# Runs the whole suite and returns the results.
+def run(engine, perft_depth, search_depth, hash_mb, symmetric = False,
+        kind = "negamax", quiescence = 0):
+    return {
+        "engine": engine,
+        "search_kind": kind,
+        "quiescence": quiescence,
+        "perft_depth": perft_depth,
+        "search_depth": search_depth,
+        "symmetry": symmetric,
+        "perft": run_perft(engine, perft_depth),
+        "search": run_search(engine, search_depth, hash_mb, symmetric, kind,
+                             quiescence),
+    }
+
+# Totals of one section of the results.
+def totals(section):
+    nodes = sum(r["nodes"] for r in section.values())
+    elapsed = sum(r["time"] for r in section.values())
+    return nodes, elapsed, nodes / max(elapsed, 1e-6)
+
+# Compares results with a baseline run. Returns report lines and the
+# number of errors: perft counts that differ, or runs that cannot be
+# compared. Node and speed changes are reported, not counted.
+def compare(results, baseline):
+    lines = []
+    errors = 0
+    for key, default in (("engine", None), ("search_kind", "negamax"),
+                         ("quiescence", 0)):
+        if results[key] != baseline.get(key, default):
+            lines.append("{} {}, baseline {}".format(
+                key, results[key], baseline.get(key, default)))
+    for key in ("perft_depth", "search_depth", "symmetry"):
+        if results[key] != baseline[key]:
+            return ["baseline has {} {}, run has {}".format(
+                key, baseline[key], results[key])], 1
+    for name, r in results["perft"].items():
+        b = baseline["perft"].get(name)
+        if b is not None and b["nodes"] != r["nodes"]:
+            lines.append("perft {}: {} nodes, baseline {}".format(
+                name, r["nodes"], b["nodes"]))
+            errors += 1
+    for name, r in results["search"].items():
+        b = baseline["search"].get(name)
+        if b is None:
+            continue
+        if b["nodes"] != r["nodes"]:
+            lines.append("search {}: {} nodes, baseline {} ({:+.1%})".format(
+                name, r["nodes"], b["nodes"], r["nodes"] / b["nodes"] - 1))
+        if b["value"] != r["value"]:
+            lines.append("search {}: value {}, baseline {}".format(
+                name, r["value"], b["value"]))
+    for section in ("perft", "search"):
+        nodes, elapsed, nps = totals(results[section])
+        b_nodes, b_elapsed, b_nps = totals(baseline[section])
+        lines.append("{}: {:.2f}s vs {:.2f}s, nps {:.0f} vs {:.0f} ({:+.1%})".format(
+            section, elapsed, b_elapsed, nps, b_nps, nps / b_nps - 1))
+    return lines, errors
@@ -0,0 +1,56 @@
+import argparse
+import json
+
+import bench
+import search
+
+def main():
+    parser = argparse.ArgumentParser(prog="python3 -m bench",
+                                     description="Gothello engine benchmarks.")
+    parser.add_argument("--engine", choices=sorted(search.ENGINES),
+                        default="bitboard")
+    parser.add_argument("--perft", type=int, default=4, metavar="DEPTH")
+    parser.add_argument("--depth", type=int, default=4,
+                        help="fixed search depth")
+    parser.add_argument("--hash", type=int, default=16, metavar="MB")
+    parser.add_argument("--search", choices=["negamax", "pvs"],
+                        default="negamax")
+    parser.add_argument("--quiescence", type=int, default=0, metavar="NODES")
+    parser.add_argument("--symmetry", action="store_true")
+    parser.add_argument("--output", metavar="FILE",
+                        help="save the results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", default=bench.BASELINE,
+                        help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store this run as the baseline")
+    args = parser.parse_args()
+
+    results = bench.run(args.engine, args.perft, args.depth, args.hash,
+                        args.symmetry, args.search, args.quiescence)
+    for section in ("perft", "search"):
+        for name, r in results[section].items():
+            print("{} {}: {} nodes {:.3f}s".format(
+                section, name, r["nodes"], r["time"]))
+        nodes, elapsed, nps = bench.totals(results[section])
+        print("{}: {} nodes {:.2f}s nps {:.0f}".format(
+            section, nodes, elapsed, nps))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        return
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        return
+    lines, errors = bench.compare(results, baseline)
+    print("compared with", args.baseline)
+    for line in lines:
+        print(line)
+    if errors:
+        exit(1)
+
+main()
@@ -0,0 +1,222 @@
+# Board that stores each color as a 25 bit integer instead of a grid.
+# Bit i * 5 + j is set when the color has a stone on row i, column j.
+# Groups, liberties and captures are found with bitwise flood fills so
+# no scratch boards are allocated during the search.
+
+import board
+from board import PLAYER_BLACK, PLAYER_WHITE, PASS
+from board import ZOBRIST, ZOBRIST_FLIP, ZOBRIST_WHITE, ZOBRIST_PASS
+from board import NO_SYMMETRY, SYM_ZOBRIST, SYM_FLIP, SYM_WHITE, SYM_WHITE_PASS
+from board import sym_xor
+
+# Initalize bitboard constants.
+FULL = (1 << 25) - 1
+COL_0 = sum(1 << (i * 5) for i in range(5))
+COL_4 = COL_0 << 4
+NOT_COL_0 = FULL & ~COL_0
+NOT_COL_4 = FULL & ~COL_4
+BIT = [1 << n for n in range(25)]
+MOVES = [(n // 5, n % 5) for n in range(25)]
+
+# Returns every point next to a set of points.
+def expand(bits):
+    return (((bits << 1) & NOT_COL_0) | ((bits >> 1) & NOT_COL_4) |
+            (bits << 5) | (bits >> 5)) & FULL
+
+# Returns the group of stones in own connected to seed.
+def flood(seed, own):
+    group = seed
+    while True:
+        grown = (group | expand(group)) & own
+        if grown == group:
+            return group
+        group = grown
+
+NEIGHBORS = [expand(b) for b in BIT]
+
+# Key changes for flipping any set of stones within one row, so a
+# capture costs five lookups whatever its size.
+ROW_FLIP = []
+SYM_ROW_FLIP = []
+for row in range(5):
+    flips = []
+    sym_flips = []
+    for pattern in range(32):
+        h = 0
+        sym = NO_SYMMETRY
+        for col in range(5):
+            if pattern & (1 << col):
+                h ^= ZOBRIST_FLIP[row * 5 + col]
+                sym = sym_xor(sym, SYM_FLIP[row * 5 + col])
+        flips.append(h)
+        sym_flips.append(sym)
+    ROW_FLIP.append(flips)
+    SYM_ROW_FLIP.append(sym_flips)
+
+class BitBoard(board.Board):
+
+    # Initalize Board variables. stones is indexed by player number.
+    def __init__(self):
+        self.best_move = None
+        self.to_move = PLAYER_BLACK
+        self.previous_move = None
+        self.stones = [0, 0, 0]
+        self.undo = []
+        self.hash = 0
+        self.sym_hashes = NO_SYMMETRY
+        self.symmetric = False
+
+    # Builds the list of lists view of the position.
+    @property
+    def grid(self):
+        black = self.stones[PLAYER_BLACK]
+        white = self.stones[PLAYER_WHITE]
+        grid = [[0] * 5 for _ in range(5)]
+        for n in range(25):
+            if black & BIT[n]:
+                grid[n // 5][n % 5] = PLAYER_BLACK
+            elif white & BIT[n]:
+                grid[n // 5][n % 5] = PLAYER_WHITE
+        return grid
+
+    def empty(self):
+        return FULL & ~(self.stones[PLAYER_BLACK] | self.stones[PLAYER_WHITE])
+
+    def empty_count(self):
+        return self.empty().bit_count()
+
+    def heval(self):
+        return (self.stones[self.to_move].bit_count() -
+                self.stones[3 - self.to_move].bit_count())
+
+    def score(self):
+        return (self.stones[PLAYER_BLACK].bit_count() -
+                self.stones[PLAYER_WHITE].bit_count())
+
+    def masks(self):
+        return self.stones[self.to_move], self.stones[3 - self.to_move]
+
+    # Plays a move in place. Captures are recorded as a bit mask. The
+    # symmetric keys are only kept up to date when symmetric is set.
+    def make_move(self, move):
+        to_move = self.to_move
+        symmetric = self.symmetric
+        h = self.hash ^ ZOBRIST_WHITE
+        if (move == PASS) != (self.previous_move == PASS):
+            h ^= ZOBRIST_PASS
+            sym = SYM_WHITE_PASS
+        else:
+            sym = SYM_WHITE
+        captured = 0
+        if move != PASS:
+            n = move[0] * 5 + move[1]
+            self.stones[to_move] |= BIT[n]
+            h ^= ZOBRIST[n][to_move]
+            if symmetric:
+                sym = sym_xor(sym, SYM_ZOBRIST[n][to_move])
+            captured = self.do_captures(move)
+            if captured:
+                for row in range(5):
+                    pattern = (captured >> (row * 5)) & 31
+                    if pattern:
+                        h ^= ROW_FLIP[row][pattern]
+                        if symmetric:
+                            sym = sym_xor(sym, SYM_ROW_FLIP[row][pattern])
+        self.undo.append((move, self.previous_move, to_move, captured,
+                          self.hash, self.sym_hashes))
+        self.previous_move = move
+        self.to_move = 3 - to_move
+        self.hash = h
+        if symmetric:
+            self.sym_hashes = sym_xor(self.sym_hashes, sym)
+
+    def unmake_move(self):
+        (move, self.previous_move, to_move, captured,
+         self.hash, self.sym_hashes) = self.undo.pop()
+        self.to_move = to_move
+        if move == PASS:
+            return
+        self.stones[to_move] &= ~(BIT[move[0] * 5 + move[1]] | captured)
+        self.stones[3 - to_move] |= captured
+
+    def move_ok(self, move):
+        if move == PASS:
+            return True
+        n = move[0] * 5 + move[1]
+        empty = self.empty()
+        if not empty & BIT[n]:
+            return False
+        if NEIGHBORS[n] & empty:
+            return True
+        group = flood(BIT[n], self.stones[self.to_move] | BIT[n])
+        return expand(group) & empty & ~BIT[n] != 0
+
+    def genMoves(self):
+        result = []
+        empty = self.empty()
+        own = self.stones[self.to_move]
+        for n in range(25):
+            if empty & BIT[n]:
+                if NEIGHBORS[n] & empty or \
+                   expand(flood(BIT[n], own | BIT[n])) & empty & ~BIT[n]:
+                    result.append(MOVES[n])
+        return result
+
+    # Returns the set of empty points where a stone would capture.
+    # Those are the last liberties of the opponent groups in atari.
+    def capture_moves(self):
+        opp = self.stones[3 - self.to_move]
+        empty = self.empty()
+        result = set()
+        while opp:
+            group = flood(opp & -opp, opp)
+            opp &= ~group
+            liberties = expand(group) & empty
+            if liberties & (liberties - 1) == 0 and liberties:
+                result.add(MOVES[liberties.bit_length() - 1])
+        return result
+
+    # Checks whether a move would capture any stones.
+    def is_capture(self, move):
+        n = move[0] * 5 + move[1]
+        opp = self.stones[3 - self.to_move]
+        empty = self.empty() & ~BIT[n]
+        adjacent = NEIGHBORS[n] & opp
+        while adjacent:
+            stone = adjacent & -adjacent
+            group = flood(stone, opp)
+            if not expand(group) & empty:
+                return True
+            adjacent &= ~group
+        return False
+
+    def liberties(self, x, y):
+        n = x * 5 + y
+        if self.stones[PLAYER_BLACK] & BIT[n]:
+            own = self.stones[PLAYER_BLACK]
+        else:
+            own = self.stones[PLAYER_WHITE]
+        return (expand(flood(BIT[n], own)) & self.empty()).bit_count()
+
+    # Returns the mask of captured stones.
+    def capture(self, x, y):
+        n = x * 5 + y
+        opp = self.stones[3 - self.to_move]
+        group = flood(BIT[n], opp)
+        if expand(group) & self.empty():
+            return 0
+        self.stones[3 - self.to_move] = opp & ~group
+        self.stones[self.to_move] |= group
+        return group
+
+    def do_captures(self, move):
+        n = move[0] * 5 + move[1]
+        captured = 0
+        adjacent = NEIGHBORS[n] & self.stones[3 - self.to_move]
+        while adjacent:
+            stone = adjacent & -adjacent
+            adjacent &= ~stone
+            m = stone.bit_length() - 1
+            if self.stones[3 - self.to_move] & stone:
+                captured |= self.capture(m // 5, m % 5)
+        return captured
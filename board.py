@@ -1,8 +1,9 @@
 # Class that manages the board state and does the negamax search.
 
-import copy
 import random
 
+import symmetry
+
 # Initalize constants.
 PLAYER_BLACK = 1
 PLAYER_WHITE = 2
@@ -14,6 +15,46 @@ UPPERBOUND = 1
 LOWERBOUND = 2
 EXACT = 3
 
+# 64 bit Zobrist keys for every point and color, the side to move and a
+# pass on the previous move. The generator is seeded so every process
+# computes the same keys.
+zobrist_random = random.Random(0x607E110)
+ZOBRIST = [[0, zobrist_random.getrandbits(64), zobrist_random.getrandbits(64)]
+           for _ in range(25)]
+ZOBRIST_FLIP = [z[PLAYER_BLACK] ^ z[PLAYER_WHITE] for z in ZOBRIST]
+ZOBRIST_WHITE = zobrist_random.getrandbits(64)
+ZOBRIST_PASS = zobrist_random.getrandbits(64)
+
+# The same keys seen through each of the 8 symmetries, so the keys of
+# all 8 images of a position can be updated together.
+SYM_ZOBRIST = [[None] + [tuple(ZOBRIST[perm[n]][color] for perm in symmetry.PERMS)
+                         for color in (PLAYER_BLACK, PLAYER_WHITE)]
+               for n in range(25)]
+SYM_FLIP = [tuple(ZOBRIST_FLIP[perm[n]] for perm in symmetry.PERMS)
+            for n in range(25)]
+SYM_WHITE = (ZOBRIST_WHITE,) * 8
+SYM_PASS = (ZOBRIST_PASS,) * 8
+SYM_WHITE_PASS = (ZOBRIST_WHITE ^ ZOBRIST_PASS,) * 8
+NO_SYMMETRY = (0,) * 8
+
+# XORs two tuples of 8 keys.
+def sym_xor(keys, other):
+    return tuple([k ^ o for k, o in zip(keys, other)])
+
+# Converts a move to the text the server uses, such as "c3" or "pass".
+def move_to_str(move):
+    if move == PASS:
+        return "pass"
+    return "abcde"[move[0]] + str(move[1] + 1)
+
+# Converts server text to a move. Returns None when it is not a move.
+def str_to_move(text):
+    if text == "pass":
+        return PASS
+    if len(text) != 2 or text[0] not in "abcde" or text[1] not in "12345":
+        return None
+    return ("abcde".index(text[0]), int(text[1]) - 1)
+
 class Board(object):
       
     # Initalize Board variables.
@@ -22,21 +63,37 @@ class Board(object):
         self.to_move = PLAYER_BLACK
         self.previous_move = None
         self.grid = [[0] * 5 for _ in range(5)]
+        self.undo = []
+        self.hash = 0
+        self.sym_hashes = NO_SYMMETRY
+        self.symmetric = False
 
     # Loops through all of the current moves and chooses the one with the highest value. 
-    def find_best_move(self, player, depth):
+    # With PVS on the root is searched within the window (a, b) instead.
+    def find_best_move(self, search, depth, a = -INF, b = INF):
         moves = self.genMoves()
         values = []
-        possible_best_moves = []
         if not moves:
             self.best_move = PASS
+            self.best_value = self.heval()
+            return
+        if search.pvs:
+            self.pvs_root(search, moves, depth, a, b)
             return
         for move in moves:
-            copy_board = copy.deepcopy(self)
-            copy_board.try_move(move)
-            value = -copy_board.negamax(player, depth, 0, -INF, INF)
+            status = self.try_move(move)
+            value = -self.negamax(search, depth, status, -INF, INF, 1)
+            if status == CONTINUE:
+                self.unmake_move()
             values.append(value)
+        self.pick_best_move(moves, values)
+
+    # Sets best_move to the move with the highest value and best_value
+    # to that value.
+    def pick_best_move(self, moves, values):
+        possible_best_moves = []
         maxval = max(values)
+        self.best_value = maxval
         # Make a list of the possible best moves.
         for value, move in zip(values, moves):
             if value == maxval:
@@ -44,12 +101,80 @@ class Board(object):
         # If there is more than oen best move pick one randomly.
         self.best_move = random.choice(possible_best_moves)
         
+    # Principal variation search over the root moves. The first move in
+    # order gets the window (a, b) and the others a narrow window around
+    # the best value so far, and are searched again with the full
+    # window only when they beat it. Values are whole numbers, so the
+    # narrow window gives moves that tie with the best their exact
+    # value and, like find_best_move, one of the tied moves is picked
+    # randomly. Every root move is searched to depth. The root is
+    # stored in the table so the next iteration tries its best move
+    # first. best_value is a bound when it falls outside (a, b).
+    def pvs_root(self, search, moves, depth, a, b):
+        orig_a = a
+        if search.symmetry:
+            key = min(self.sym_hashes)
+            sym = self.sym_hashes.index(key)
+        else:
+            key = self.hash
+            sym = 0
+        ttEntry = search.table.ttLookup(key)
+        tt_move = symmetry.move_from(sym, ttEntry.move)
+        moves = self.order_moves(search, moves, tt_move, 0)
+        value = -INF
+        best_moves = []
+        for i, move in enumerate(moves):
+            status = self.try_move(move)
+            if i == 0:
+                score = -self.negamax(search, depth, status, -b, -a, 1)
+            else:
+                score = -self.negamax(search, depth, status, -a - 1, -a + 1, 1)
+                if a < score < b:
+                    score = -self.negamax(search, depth, status, -b, -a, 1)
+            if status == CONTINUE:
+                self.unmake_move()
+            if score > value:
+                value = score
+                best_moves = [move]
+            elif score == value:
+                best_moves.append(move)
+            a = max(a, value)
+            if a >= b:
+                break
+        best = random.choice(best_moves)
+        if value <= orig_a:
+            ttEntry.flag = UPPERBOUND
+        elif value >= b:
+            ttEntry.flag = LOWERBOUND
+        else:
+            ttEntry.flag = EXACT
+        ttEntry.value = value
+        ttEntry.depth = depth + 1
+        ttEntry.move = symmetry.move_to(sym, best)
+        search.table.ttStore(key, ttEntry)
+        self.best_move = best
+        self.best_value = value
+
     # Negamax search with alpha-beta pruning and a transposition table.
     # Adapted from pseudocode on the negamax Wikipedia page.
     # http://en.wikipedia.org/wiki/Negamax
-    def negamax(self, player, depth, status, a, b):
+    # The search checks the clock every 1024 nodes. ply is the distance
+    # from the root and indexes the killer moves. With PVS on, every
+    # move after the first is tried with a null window first.
+    def negamax(self, search, depth, status, a, b, ply):
+        search.nodes += 1
+        if not search.nodes & 1023:
+            search.check_time()
         orig_a = a
-        ttEntry = player.table.ttLookup(self.grid)
+        # With symmetry on, mirrored and rotated positions share the
+        # canonical key and stored moves are kept in its orientation.
+        if search.symmetry:
+            key = min(self.sym_hashes)
+            sym = self.sym_hashes.index(key)
+        else:
+            key = self.hash
+            sym = 0
+        ttEntry = search.table.ttLookup(key)
         # Check to see if the tt can be used to return early.
         if ttEntry.depth >= depth:
             if ttEntry.flag == EXACT:
@@ -62,17 +187,34 @@ class Board(object):
                 return ttEntry.value
         
         if depth == 0 or status == GAME_OVER:
-            return self.heval()
+            if status == GAME_OVER:
+                return self.heval()
+            if search.quiescence:
+                search.qnode_limit = search.qnodes + search.quiescence
+                return self.quiesce(search, a, b)
+            return self.evaluate(search)
 
-        moves = self.genMoves()
+        tt_move = symmetry.move_from(sym, ttEntry.move)
+        moves = self.order_moves(search, self.genMoves(), tt_move, ply)
         value = -INF
+        best = None
         # Check every move and find the max value of all of them.
-        for move in moves:
-            copy_board = copy.deepcopy(self)
-            status = copy_board.try_move(move)
-            value = max(value, -copy_board.negamax(player, depth - 1, status, -b, -a))
+        for i, move in enumerate(moves):
+            status = self.try_move(move)
+            if i == 0 or not search.pvs:
+                score = -self.negamax(search, depth - 1, status, -b, -a, ply + 1)
+            else:
+                score = -self.negamax(search, depth - 1, status, -a - 1, -a, ply + 1)
+                if a < score < b:
+                    score = -self.negamax(search, depth - 1, status, -b, -a, ply + 1)
+            if status == CONTINUE:
+                self.unmake_move()
+            if score > value:
+                value = score
+                best = move
             a = max(a, value)
             if a >= b:
+                search.cutoff(move, depth, ply, i)
                 break
         
         # Update the tt and store the entry.
@@ -84,10 +226,124 @@ class Board(object):
             ttEntry.flag = EXACT
         ttEntry.value = value
         ttEntry.depth = depth
-        player.table.ttStore(self.grid, ttEntry)
+        ttEntry.move = symmetry.move_to(sym, best)
+        search.table.ttStore(key, ttEntry)
         
         return value
 
+    # Quiescence search past the horizon. A capture can flip a whole
+    # group, so instead of trusting heval in the middle of an exchange
+    # only captures are searched on until the position is quiet. The
+    # side to move may also stand pat on heval, since it can always
+    # play a quiet move instead. Each horizon position gets at most
+    # search.quiescence nodes, after which heval is used as it is.
+    def quiesce(self, search, a, b):
+        search.qnodes += 1
+        if not search.qnodes & 1023:
+            search.check_time()
+        value = self.evaluate(search)
+        if value >= b or search.qnodes >= search.qnode_limit:
+            return value
+        a = max(a, value)
+        for move in self.capture_moves():
+            # A capturing point with no liberty of its own is still
+            # suicide.
+            if not self.move_ok(move):
+                continue
+            self.make_move(move)
+            score = -self.quiesce(search, -b, -a)
+            self.unmake_move()
+            if score > value:
+                value = score
+            a = max(a, value)
+            if a >= b:
+                break
+        return value
+
+    # Orders moves so alpha-beta sees the likely best move first: the
+    # move stored in the table, then captures, then the killer moves
+    # for this ply, then everything else by its history score.
+    def order_moves(self, search, moves, tt_move, ply):
+        killers = search.killers[ply]
+        history = search.history
+        captures = self.capture_moves()
+        def score(move):
+            if move == tt_move:
+                return 1 << 30
+            if move in captures:
+                return 1 << 29
+            if move == killers[0]:
+                return (1 << 28) + 1
+            if move == killers[1]:
+                return 1 << 28
+            return history[move[0] * 5 + move[1]]
+        return sorted(moves, key=score, reverse=True)
+
+    # Returns the set of empty points where a stone would capture.
+    # Those are the last liberties of the opponent groups in atari, so
+    # each opponent group is flooded once.
+    def capture_moves(self):
+        opp = self.opponent(self.to_move)
+        seen = self.scratch_board()
+        result = set()
+        for x in range(5):
+            for y in range(5):
+                if self.grid[x][y] != opp or seen[x][y]:
+                    continue
+                scratch = self.scratch_board()
+                self.flood(scratch, opp, x, y)
+                liberties = []
+                for i in range(5):
+                    for j in range(5):
+                        if scratch[i][j]:
+                            seen[i][j] = True
+                        elif self.grid[i][j] == 0 and self.group_border(scratch, i, j):
+                            liberties.append((i, j))
+                if len(liberties) == 1:
+                    result.add(liberties[0])
+        return result
+
+    # Checks whether a move would capture any stones.
+    def is_capture(self, move):
+        opp = self.opponent(self.to_move)
+        x, y = move
+        self.grid[x][y] = self.to_move
+        captures = False
+        for i, j in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if i >= 0 and i <= 4 and j >= 0 and j <= 4 and \
+               self.grid[i][j] == opp and self.liberties(i, j) == 0:
+                captures = True
+                break
+        self.grid[x][y] = 0
+        return captures
+
+    # Value of a position that is not over for the side to move: the
+    # pattern evaluation when the search has one, else heval.
+    def evaluate(self, search):
+        if search.patterns is not None:
+            return search.patterns.evaluate(self)
+        return self.heval()
+
+    # Returns the stones of the side to move and of its opponent as
+    # bit masks laid out like bitboard.BitBoard.
+    def masks(self):
+        own = 0
+        opp = 0
+        bit = 1
+        for row in self.grid:
+            for cell in row:
+                if cell == self.to_move:
+                    own |= bit
+                elif cell:
+                    opp |= bit
+                bit <<= 1
+        return own, opp
+
+    # Black stones minus white stones, the score of a finished game.
+    def score(self):
+        return sum(row.count(PLAYER_BLACK) - row.count(PLAYER_WHITE)
+                   for row in self.grid)
+
     # All functions below this line are adapted directly from Grossthello
     # https://github.com/pdx-cs-ai/gothello-grossthello supplied by Bart Massey
     def heval(self):
@@ -101,18 +357,83 @@ class Board(object):
                     ostones += 1
         return nstones - ostones
 
+    # Computes the Zobrist key of the position from scratch.
+    def compute_hash(self):
+        h = 0
+        grid = self.grid
+        for i in range(5):
+            for j in range(5):
+                if grid[i][j] != 0:
+                    h ^= ZOBRIST[i * 5 + j][grid[i][j]]
+        if self.to_move == PLAYER_WHITE:
+            h ^= ZOBRIST_WHITE
+        if self.previous_move == PASS:
+            h ^= ZOBRIST_PASS
+        return h
+
+    # Computes the keys of the 8 symmetric images from scratch.
+    def compute_sym_hashes(self):
+        keys = NO_SYMMETRY
+        grid = self.grid
+        for i in range(5):
+            for j in range(5):
+                if grid[i][j] != 0:
+                    keys = sym_xor(keys, SYM_ZOBRIST[i * 5 + j][grid[i][j]])
+        if self.to_move == PLAYER_WHITE:
+            keys = sym_xor(keys, SYM_WHITE)
+        if self.previous_move == PASS:
+            keys = sym_xor(keys, SYM_PASS)
+        return keys
+
+    # Plays a move in place and pushes the placed stone, the captured
+    # cells, the previous move, the side to move and the keys on the
+    # undo stack. The keys are updated incrementally, the symmetric ones
+    # only when symmetric is set.
     def make_move(self, move):
+        to_move = self.to_move
+        symmetric = self.symmetric
+        h = self.hash ^ ZOBRIST_WHITE
+        if (move == PASS) != (self.previous_move == PASS):
+            h ^= ZOBRIST_PASS
+            sym = SYM_WHITE_PASS
+        else:
+            sym = SYM_WHITE
+        captured = None
+        if move != PASS:
+            n = move[0] * 5 + move[1]
+            self.grid[move[0]][move[1]] = to_move
+            h ^= ZOBRIST[n][to_move]
+            if symmetric:
+                sym = sym_xor(sym, SYM_ZOBRIST[n][to_move])
+            captured = self.do_captures(move)
+            for (i, j) in captured:
+                h ^= ZOBRIST_FLIP[i * 5 + j]
+                if symmetric:
+                    sym = sym_xor(sym, SYM_FLIP[i * 5 + j])
+        self.undo.append((move, self.previous_move, to_move, captured,
+                          self.hash, self.sym_hashes))
         self.previous_move = move
+        self.to_move = self.opponent(to_move)
+        self.hash = h
+        if symmetric:
+            self.sym_hashes = sym_xor(self.sym_hashes, sym)
+
+    # Takes back the last move played with make_move.
+    def unmake_move(self):
+        (move, self.previous_move, to_move, captured,
+         self.hash, self.sym_hashes) = self.undo.pop()
+        self.to_move = to_move
         if move == PASS:
             return
-        self.grid[move[0]][move[1]] = self.to_move
-        self.do_captures(move)
+        self.grid[move[0]][move[1]] = 0
+        opp = self.opponent(to_move)
+        for (i, j) in captured:
+            self.grid[i][j] = opp
 
     def try_move(self, move):
         if move == PASS and self.previous_move == PASS:
             return GAME_OVER
         self.make_move(move)
-        self.to_move = self.opponent(self.to_move)
         return CONTINUE
 
     def move_ok(self, move):
@@ -127,6 +448,9 @@ class Board(object):
             return False
         return True
 
+    def empty_count(self):
+        return sum(row.count(0) for row in self.grid)
+
     def opponent(self, player):
         if player == PLAYER_BLACK:
             return PLAYER_WHITE 
@@ -182,23 +506,30 @@ class Board(object):
                     n += 1
         return n
 
+    # Returns the cells that were captured.
     def capture(self, x, y):
+        captured = []
         if self.liberties(x, y) > 0:
-          return
+          return captured
         scratch = self.scratch_board()
         self.flood(scratch, self.grid[x][y], x, y)
         for i in range(5):
             for j in range(5):
                 if scratch[i][j]:
                     self.grid[i][j] = self.to_move
+                    captured.append((i, j))
+        return captured
 
+    # Returns the cells captured by move.
     def do_captures(self, move):
         to_move = self.to_move
+        captured = []
         if move[0] > 0 and self.grid[move[0] - 1][move[1]] == self.opponent(to_move):
-            self.capture(move[0] - 1, move[1])
+            captured += self.capture(move[0] - 1, move[1])
         if move[0] < 4 and self.grid[move[0] + 1][move[1]] == self.opponent(to_move):
-            self.capture(move[0] + 1, move[1])
+            captured += self.capture(move[0] + 1, move[1])
         if move[1] > 0 and self.grid[move[0]][move[1] - 1] == self.opponent(to_move):
-            self.capture(move[0], move[1] - 1)
+            captured += self.capture(move[0], move[1] - 1)
         if move[1] < 4 and self.grid[move[0]][move[1] + 1] == self.opponent(to_move):
-            self.capture(move[0], move[1] + 1)
+            captured += self.capture(move[0], move[1] + 1)
+        return captured
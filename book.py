@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# Opening book. The book is built offline by searching every position
+# in the first few plies deeply with the normal engine. Positions that
+# are the same under symmetry are merged, and the results are written
+# to a binary file sorted by canonical key. The player looks positions
+# up through mmap with a binary search, so opening a book costs the
+# same whatever its size.
+#
+# File layout: an 8 byte magic, the record count as an unsigned 64 bit
+# integer, then the records. Each record is the canonical key, the best
+# move in the canonical orientation (row * 5 + column, or 25 for a
+# pass), its value and the depth it was searched to.
+
+import argparse
+import copy
+import mmap
+import struct
+import time
+
+import bitboard
+import search
+import symmetry
+import table
+from board import PASS
+
+MAGIC = b"GTHBOOK1"
+HEADER = struct.Struct("<8sQ")
+RECORD = struct.Struct("<QBhB")
+PASS_MOVE = 25
+VALUE_LIMIT = 32767
+
+def encode_move(move):
+    if move == PASS:
+        return PASS_MOVE
+    return move[0] * 5 + move[1]
+
+def decode_move(n):
+    if n == PASS_MOVE:
+        return PASS
+    return (n // 5, n % 5)
+
+class Book(object):
+
+    # Map the book file at path. magic tells books of different kinds
+    # apart.
+    def __init__(self, path, magic = MAGIC):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        file_magic, self.count = HEADER.unpack_from(self.map, 0)
+        if file_magic != magic:
+            raise ValueError("{}: not a {} file".format(path, magic.decode()))
+
+    # Binary search for a canonical key. Returns the record's
+    # (move, value, depth) or None.
+    def lookup(self, key):
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * RECORD.size
+            record = RECORD.unpack_from(self.map, offset)
+            if record[0] < key:
+                lo = mid + 1
+            elif record[0] > key:
+                hi = mid
+            else:
+                return record[1:]
+        return None
+
+    # Returns the book move for board in its own orientation, or None.
+    def probe(self, board):
+        key, s = symmetry.canonical(board)
+        record = self.lookup(key)
+        if record is None:
+            return None
+        return symmetry.move_from(s, decode_move(record[0]))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+# Packs a record for board, with move in the board's own orientation.
+def make_record(board, move, value, depth):
+    key, s = symmetry.canonical(board)
+    value = max(-VALUE_LIMIT, min(VALUE_LIMIT, value))
+    return key, RECORD.pack(key, encode_move(symmetry.move_to(s, move)),
+                            value, depth)
+
+# Writes records, a list of (key, packed record), sorted by key.
+def write(path, records, magic = MAGIC):
+    records.sort()
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(magic, len(records)))
+        for key, record in records:
+            f.write(record)
+
+# Collects one board for every canonical position up to plies moves
+# from the empty board.
+def opening_positions(plies):
+    positions = {}
+    frontier = [bitboard.BitBoard()]
+    for ply in range(plies + 1):
+        next_frontier = []
+        for position in frontier:
+            key = symmetry.canonical(position)[0]
+            if key in positions:
+                continue
+            positions[key] = position
+            if ply == plies:
+                continue
+            for move in position.genMoves():
+                child = copy.deepcopy(position)
+                child.try_move(move)
+                next_frontier.append(child)
+        frontier = next_frontier
+    return positions
+
+# Searches every opening position to depth and writes the book.
+def build(path, plies, depth, hash_mb):
+    positions = opening_positions(plies)
+    state = search.Search(table.Table(hash_mb))
+    records = []
+    start = time.time()
+    for n, position in enumerate(positions.values()):
+        move = state.iterate(position, depth)
+        records.append(make_record(position, move, state.value, depth))
+        print("{}/{} {:.0f}s".format(n + 1, len(positions), time.time() - start))
+    write(path, records)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Gothello opening book.")
+    parser.add_argument("output")
+    parser.add_argument("--plies", type=int, default=3,
+                        help="moves from the empty board to cover")
+    parser.add_argument("--depth", type=int, default=5,
+                        help="search depth for each position")
+    parser.add_argument("--hash", type=int, default=64, metavar="MB")
+    args = parser.parse_args()
+    build(args.output, args.plies, args.depth, args.hash)
+
+if __name__ == "__main__":
+    main()
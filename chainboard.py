@@ -0,0 +1,145 @@
+# Bitboard that also keeps every group of stones (a chain) and its
+# liberties up to date as moves are made and unmade. chain[n] is the
+# mask of the chain holding the stone on point n and libs[n] is the
+# mask of that chain's liberties, so legality, suicide and capture
+# checks are lookups instead of flood fills. Making a move copies the
+# two lists before changing them and unmaking a move puts the old ones
+# back.
+
+import bitboard
+from bitboard import BIT, NEIGHBORS, MOVES
+from board import PASS
+
+class ChainBoard(bitboard.BitBoard):
+
+    # Initalize Board variables.
+    def __init__(self):
+        bitboard.BitBoard.__init__(self)
+        self.chain = [0] * 25
+        self.libs = [0] * 25
+        self.chain_undo = []
+
+    def make_move(self, move):
+        self.chain_undo.append((self.chain, self.libs))
+        if move != PASS:
+            self.chain = list(self.chain)
+            self.libs = list(self.libs)
+        bitboard.BitBoard.make_move(self, move)
+
+    def unmake_move(self):
+        bitboard.BitBoard.unmake_move(self)
+        self.chain, self.libs = self.chain_undo.pop()
+
+    # Sets the chain and liberties of every stone in group.
+    def set_chain(self, group, libs):
+        stones = group
+        while stones:
+            stone = stones & -stones
+            stones ^= stone
+            n = stone.bit_length() - 1
+            self.chain[n] = group
+            self.libs[n] = libs
+
+    def move_ok(self, move):
+        if move == PASS:
+            return True
+        n = move[0] * 5 + move[1]
+        empty = self.empty()
+        if not empty & BIT[n]:
+            return False
+        return self.has_liberty(n, empty)
+
+    # Checks whether a stone of the side to move on the empty point n
+    # would have a liberty before any captures.
+    def has_liberty(self, n, empty):
+        if NEIGHBORS[n] & empty:
+            return True
+        own = NEIGHBORS[n] & self.stones[self.to_move]
+        while own:
+            stone = own & -own
+            own ^= stone
+            if self.libs[stone.bit_length() - 1] & ~BIT[n]:
+                return True
+        return False
+
+    def genMoves(self):
+        result = []
+        empty = self.empty()
+        for n in range(25):
+            if empty & BIT[n] and self.has_liberty(n, empty):
+                result.append(MOVES[n])
+        return result
+
+    def liberties(self, x, y):
+        return self.libs[x * 5 + y].bit_count()
+
+    # Returns the set of empty points where a stone would capture.
+    # Those are the last liberties of the opponent chains in atari.
+    def capture_moves(self):
+        opp = self.stones[3 - self.to_move]
+        result = set()
+        while opp:
+            n = (opp & -opp).bit_length() - 1
+            opp &= ~self.chain[n]
+            libs = self.libs[n]
+            # A full board leaves chains with no liberties at all.
+            if libs and libs & (libs - 1) == 0:
+                result.add(MOVES[libs.bit_length() - 1])
+        return result
+
+    # Checks whether a move would capture any stones.
+    def is_capture(self, move):
+        n = move[0] * 5 + move[1]
+        adjacent = NEIGHBORS[n] & self.stones[3 - self.to_move]
+        while adjacent:
+            stone = adjacent & -adjacent
+            adjacent ^= stone
+            if self.libs[stone.bit_length() - 1] == BIT[n]:
+                return True
+        return False
+
+    # Called by make_move once the new stone is on the board. Merges the
+    # new stone with its neighbors, takes its point from the liberties
+    # of the opponent chains next to it and flips the ones left without
+    # liberties. Returns the mask of captured stones.
+    def do_captures(self, move):
+        n = move[0] * 5 + move[1]
+        b = BIT[n]
+        to_move = self.to_move
+        own = self.stones[to_move]
+        opp = self.stones[3 - to_move]
+        empty = self.empty()
+        group = b
+        libs = NEIGHBORS[n] & empty
+        adjacent = NEIGHBORS[n] & own
+        while adjacent:
+            m = (adjacent & -adjacent).bit_length() - 1
+            adjacent &= ~self.chain[m]
+            group |= self.chain[m]
+            libs |= self.libs[m]
+        captured = 0
+        adjacent = NEIGHBORS[n] & opp
+        while adjacent:
+            m = (adjacent & -adjacent).bit_length() - 1
+            other = self.chain[m]
+            adjacent &= ~other
+            other_libs = self.libs[m] & ~b
+            if other_libs:
+                self.set_chain(other, other_libs)
+            else:
+                captured |= other
+        if captured:
+            self.stones[3 - to_move] = opp & ~captured
+            own |= captured
+            self.stones[to_move] = own
+            group |= captured
+            # Captured stones have no empty neighbors, but they can join
+            # the new chain to other chains of the side to move.
+            adjacent = bitboard.expand(captured) & own & ~group
+            while adjacent:
+                m = (adjacent & -adjacent).bit_length() - 1
+                adjacent &= ~self.chain[m]
+                group |= self.chain[m]
+                libs |= self.libs[m]
+        self.set_chain(group, libs & ~b)
+        return captured
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+# Exact endgame solver. Once only a few points are empty the game tree
+# is small enough to search to the end, so instead of the stone count
+# heuristic the solver finds the real result: 1 for a win, 0 for a
+# draw and -1 for a loss for the side to move. A pass is always
+# allowed and two passes in a row end the game, which is then won by
+# the side with more stones.
+#
+# Running this file builds a table of solved positions: it plays
+# random games until few enough points are empty, solves every
+# position reached and writes them as a book file for instant lookup
+# during play.
+
+import argparse
+import array
+import copy
+import random
+import time
+
+import bitboard
+import book
+import symmetry
+from board import PASS
+
+MAGIC = b"GTHEND01"
+
+# Bytes used by one cache slot: a key and a result.
+SLOT_BYTES = 9
+
+# Results are cached as value + 1 in the low two bits and a bound flag
+# above them. Zero marks an empty slot.
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+class Solver(object):
+
+    # Allocate a direct mapped cache of about size_mb megabytes.
+    def __init__(self, size_mb = 4):
+        slots = 1
+        while slots * 2 * SLOT_BYTES <= size_mb * (1 << 20):
+            slots *= 2
+        self.mask = slots - 1
+        self.keys = array.array('Q', bytes(slots * 8))
+        self.values = array.array('B', bytes(slots))
+        self.nodes = 0
+        self.search = None
+
+    # Result of the game for the side to move if both pass now.
+    def final_result(self, board):
+        score = board.heval()
+        return (score > 0) - (score < 0)
+
+    # Solves board for the side to move within the window (a, b).
+    # When search is set its clock is checked every 1024 nodes.
+    def solve(self, board, a = -1, b = 1):
+        self.nodes += 1
+        if self.search is not None and not self.nodes & 1023:
+            self.search.check_time()
+        key = board.hash
+        slot = key & self.mask
+        cached = self.values[slot]
+        if cached and self.keys[slot] == key:
+            value = (cached & 3) - 1
+            flag = cached >> 2
+            if flag == EXACT:
+                return value
+            elif flag == LOWER:
+                a = max(a, value)
+            else:
+                b = min(b, value)
+            if a >= b:
+                return value
+        orig_a = a
+        best = -2
+        moves = board.genMoves()
+        moves.append(PASS)
+        for move in moves:
+            if move == PASS and board.previous_move == PASS:
+                value = self.final_result(board)
+            else:
+                board.make_move(move)
+                value = -self.solve(board, -b, -a)
+                board.unmake_move()
+            if value > best:
+                best = value
+            a = max(a, value)
+            if a >= b:
+                break
+        if best <= orig_a:
+            flag = UPPER
+        elif best >= b:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.keys[slot] = key
+        self.values[slot] = (best + 1) | (flag << 2)
+        return best
+
+    # Returns the best move for the side to move and its result.
+    def best_move(self, board):
+        best = -2
+        best_move = PASS
+        moves = board.genMoves()
+        moves.append(PASS)
+        for move in moves:
+            if move == PASS and board.previous_move == PASS:
+                value = self.final_result(board)
+            else:
+                board.make_move(move)
+                value = -self.solve(board, -1, -max(best, -1))
+                board.unmake_move()
+            if value > best:
+                best = value
+                best_move = move
+            if best == 1:
+                break
+        return best_move, best
+
+# Plays random games and returns one board for every canonical
+# position reached with empties or fewer empty points.
+def endgame_positions(empties, games):
+    positions = {}
+    for _ in range(games):
+        board = bitboard.BitBoard()
+        while board.empty_count() > empties:
+            moves = board.genMoves()
+            if not moves:
+                break
+            board.try_move(random.choice(moves))
+        if board.empty_count() > empties:
+            continue
+        key = symmetry.canonical(board)[0]
+        if key not in positions:
+            positions[key] = copy.deepcopy(board)
+    return positions
+
+# Solves the positions and writes them to path.
+def build(path, empties, games, size_mb):
+    positions = endgame_positions(empties, games)
+    solver = Solver(size_mb)
+    records = []
+    start = time.time()
+    for n, board in enumerate(positions.values()):
+        move, value = solver.best_move(board)
+        records.append(book.make_record(board, move, value, board.empty_count()))
+        print("{}/{} {:.0f}s".format(n + 1, len(positions), time.time() - start))
+    book.write(path, records, MAGIC)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Gothello endgame table.")
+    parser.add_argument("output")
+    parser.add_argument("--empties", type=int, default=8,
+                        help="solve positions with this many empty points")
+    parser.add_argument("--games", type=int, default=1000,
+                        help="random games played to find positions")
+    parser.add_argument("--hash", type=int, default=16, metavar="MB")
+    args = parser.parse_args()
+    build(args.output, args.empties, args.games, args.hash)
+
+if __name__ == "__main__":
+    main()
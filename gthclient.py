@@ -68,22 +68,19 @@ def opponent(who):
         return "white"
     assert False
 
-class GthClient(object):
+class GthProtocol(object):
     """
-    Gothello client class.
+    Gothello protocol state and message handling, shared
+    by the blocking client and the asyncio client in
+    agthclient. Subclasses read and write the messages.
     """
 
-    def __init__(self, side, host, server):
+    def __init__(self, side):
         """
-        Give a side ("white" or "black"), the
-        hostname of the server, and the "server-number"
-        of that server, create a new Gothello client.
+        Set up the state of a client playing side
+        ("white" or "black").
         """
 
-        # Sockets for managing the server interaction.
-        self.fsock_in = None
-        self.fsock_out = None
-
         # Current move number.
         self.serial = 1
 
@@ -99,35 +96,44 @@ class GthClient(object):
         # Side we are playing.
         self.who = side
 
-        # Connect to the server.
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect((host, server_base + server))
-        self.fsock_in = sock.makefile(
-            "r",
-            buffering=1,
-            encoding="utf_8",
-            newline="\r\n",
-        )
-        self.fsock_out = sock.makefile(
-            "w",
-            buffering=1,
-            encoding="utf_8",
-            newline="\r",
-        )
+    def parse_msg(self, line):
+        """
+        Decode a line from the server. Returns None for
+        a blank line, else a tuple of the decoded message
+        code and the rest of the message text.
+        """
+
+        words = line.split()
+        if len(words) == 0:
+            return None
+        if len(words[0]) != 3:
+            raise MessageError(line, "invalid message code")
+        for c in words[0]:
+            if c not in "0123456789":
+                raise MessageError(c, "invalid message code digit")
+        msg_code = int(words[0])
+        msg_text = ' '.join(words[1:])
+        return (msg_code, msg_text)
+
+    def check_greeting(self, msg_code, msg_text):
+        """
+        Check that this is a valid server. Returns the
+        line telling the server what we're doing.
+        """
 
-        # Check that this is a valid server.
-        msg_code, msg_text = self.get_msg()
         if msg_code != 0:
             raise ProtocolError(
                 msg_code,
                 msg_text,
                 "illegal greeting",
             )
+        return "{} player {}".format(client_version, self.who)
+
+    def check_side(self, msg_code, msg_text):
+        """
+        Check the ack of our side and get time controls.
+        """
 
-        # Tell the server what we're doing. Get ack and
-        # time controls.
-        self.send("{} player {}".format(client_version, side))
-        msg_code, msg_text = self.get_msg()
         if msg_code not in {100, 101}:
             raise ProtocolError(
                 msg_code,
@@ -137,55 +143,26 @@ class GthClient(object):
 
         if msg_code == 101:
             self.get_time_controls(msg_text)
-            if side == "white":
-                self.my_time = white_time_control
-                self.opp_time = black_time_control
+            if self.who == "white":
+                self.my_time = self.white_time_control
+                self.opp_time = self.black_time_control
             else:
-                self.my_time = black_time_control
-                self.opp_time = white_time_control
+                self.my_time = self.black_time_control
+                self.opp_time = self.white_time_control
 
-        
-        # Wait for the opponent to connect and check that
-        # they are playing the other side.
-        msg_code, msg_text = self.get_msg()
-        if (msg_code != 351 and side == "white") or \
-           (msg_code != 352 and side == "black"):
+    def check_opponent(self, msg_code, msg_text):
+        """
+        Check that the opponent is playing the other side.
+        """
+
+        if (msg_code != 351 and self.who == "white") or \
+           (msg_code != 352 and self.who == "black"):
             raise ProtocolError(
                 msg_code,
                 msg_text,
                 "got wrong side",
             )
 
-    def get_msg(self):
-        """
-        Get a message from the server. Ignores blank lines.
-        Returns a tuple of the decoded message code and the
-        rest of the message text.
-        """
-
-        while True:
-            line = next(self.fsock_in)
-            words = line.split()
-            if len(words) > 0:
-                break
-        if len(words[0]) != 3:
-            raise MessageError(line, "invalid message code")
-        for c in words[0]:
-            if c not in "0123456789":
-                raise MessageError(c, "invalid message code digit")
-        msg_code = int(words[0])
-        msg_text = ' '.join(words[1:])
-        return (msg_code, msg_text)
-    
-
-    def closeall(self):
-        """
-        Close the sockets, disconnecting from the server.
-        """
-        
-        self.fsock_out.close()
-        self.fsock_in.close()
-
     def get_time_controls(self, msg_text):
         words = msg_text.split()
         time_controls = [int(t) for t in words[:2]]
@@ -194,63 +171,58 @@ class GthClient(object):
         if len(time_controls) > 1:
             self.black_time_control = time_controls[1]
         else:    
-            self.black_time_control = white_time_control
+            self.black_time_control = self.white_time_control
 
 
     def get_time(self, msg_text):
         words = msg_text.split()
         return int(words[0])
 
-
-    def send(self, msg_text):
+    def check_game_on(self, message):
         """
-        Send a line to the server.
+        Raise a MoveError if the game is over.
         """
 
-        print(
-            msg_text,
-            file=self.fsock_out,
-            end="\r\n",
-        )
-        self.fsock_out.flush()
-
-    def make_move(self, pos):
-        """
-        Given a position string in standard format or
-        "pass", send to the server.
-        """
-
-        # Check that game is still on.
         if self.winner != None:
             raise MoveError(
                 MoveError.DONE,
-                "move with game over",
+                message,
             )
 
-        # Send the move to the server.
+    def move_line(self, pos):
+        """
+        Given a position string in standard format or
+        "pass", return the line sending it to the server.
+        """
+
+        self.check_game_on("move with game over")
         if self.who == "black":
             ellipses = ""
         elif self.who == "white":
             ellipses = " ..."
         else:
             assert False
-        self.send("{}{} {}".format(self.serial, ellipses, pos))
+        return "{}{} {}".format(self.serial, ellipses, pos)
+
+    def move_ack(self, msg_code, msg_text):
+        """
+        Handle the server's ack of our move. Returns False
+        when the game is over.
+        """
 
-        # Get an ack from the server.
-        msg_code, msg_text = self.get_msg()
         if msg_code == 201:
             self.winner = self.who
         elif msg_code == 202:
             self.winner = opponent(self.who)
+        elif msg_code == 204:
+            self.winner = "draw"
         elif msg_code == 203:
             raise MoveError(
                 MoveError.DISCO,
                 "disconnected",
             )
 
-        # If game is over shut down the connection.
         if self.winner != None:
-            self.closeall()
             return False
 
         # Check for issues.
@@ -270,9 +242,13 @@ class GthClient(object):
         # Record time remaining if needed.
         if msg_code == 207:
             self.my_time = self.get_time(msg_text)
+        return True
+
+    def move_status(self, msg_code, msg_text):
+        """
+        Check the game status that follows the ack.
+        """
 
-        # Get the game status.
-        msg_code, msg_text = self.get_msg();
         if msg_code < 311 or msg_code > 318:
             raise ProtocolError(
                 msg_code,
@@ -280,27 +256,20 @@ class GthClient(object):
                 "unexpected move status code",
             )
 
-        return True
-
-
-    def get_move(self):
+    def opp_move(self, msg_code, msg_text):
         """
-        Get an opponent move from the server. Returns
-        a tuple: a boolean that is False when the
-        game is over, and the actual move string.
+        Parse an opponent move message. Returns a tuple: a
+        boolean that is False when the game is over, and
+        the actual move string.
         """
 
-        # Check that game is still on.
-        if self.winner != None:
-            raise MoveError(
-                MoveError.DONE,
-                "read move with game over",
-            )
+        # A win on time comes without a move.
+        if msg_code in {361, 362}:
+            self.winner = "black" if msg_code == 361 else "white"
+            return (False, None)
 
-        # Get the move and parse it.
-        msg_code, msg_text = self.get_msg()
         words = msg_text.split()
-        if msg_code in {311, 321, 322, 325, 315}:
+        if msg_code in {311, 321, 322, 325, 315, 327}:
             side = "black"
             self.serial = int(words[0])
             pos = words[1]
@@ -309,7 +278,7 @@ class GthClient(object):
             self.serial = int(words[0])
             pos = words[1]
             self.opp_time = int(words[2])
-        elif msg_code in {312, 323, 324, 326, 316}:
+        elif msg_code in {312, 323, 324, 326, 316, 328}:
             side = "white"
             self.serial = int(words[0])
             pos = words[2]
@@ -317,7 +286,7 @@ class GthClient(object):
             side = "white"
             self.serial = int(words[0])
             pos = words[2]
-            self.opp_time = int(words[2])
+            self.opp_time = int(words[3])
         else:
             raise ProtocolError(
                 msg_code,
@@ -337,12 +306,15 @@ class GthClient(object):
         if self.who == "white":
             if msg_code in {311, 313, 315, 317}:
                 return (True, pos)
-            if msg_code in {321, 361}:
+            if msg_code == 321:
                 self.winner = "black"
                 return (False, pos)
-            if msg_code in {322, 362}:
+            if msg_code == 322:
                 self.winner = "white"
                 return (False, pos)
+            if msg_code == 327:
+                self.winner = "draw"
+                return (False, pos)
             if msg_code == 325:
                 raise MoveError(
                     MoveError.DISCO,
@@ -354,12 +326,15 @@ class GthClient(object):
             self.serial += 1
             if msg_code in {312, 314, 316, 318}:
                 return (True, pos)
-            if msg_code in {323, 362}:
+            if msg_code == 323:
                 self.winner = "white"
                 return (False, pos)
-            if msg_code in {324, 361}:
+            if msg_code == 324:
                 self.winner = "black"
                 return (False, pos)
+            if msg_code == 328:
+                self.winner = "draw"
+                return (False, pos)
             if msg_code == 326:
                 raise MoveError(
                     MoveError.DISCO,
@@ -368,3 +343,111 @@ class GthClient(object):
             assert False
         else:
             assert False
+
+class GthClient(GthProtocol):
+    """
+    Gothello client class.
+    """
+
+    def __init__(self, side, host, server):
+        """
+        Give a side ("white" or "black"), the
+        hostname of the server, and the "server-number"
+        of that server, create a new Gothello client.
+        """
+
+        GthProtocol.__init__(self, side)
+
+        # Sockets for managing the server interaction.
+        self.fsock_in = None
+        self.fsock_out = None
+
+        # Connect to the server.
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((host, server_base + server))
+        self.fsock_in = sock.makefile(
+            "r",
+            buffering=1,
+            encoding="utf_8",
+            newline="\r\n",
+        )
+        self.fsock_out = sock.makefile(
+            "w",
+            buffering=1,
+            encoding="utf_8",
+            newline="\r",
+        )
+
+        # Check that this is a valid server, tell the server
+        # what we're doing and get ack and time controls.
+        self.send(self.check_greeting(*self.get_msg()))
+        self.check_side(*self.get_msg())
+
+        # Wait for the opponent to connect and check that
+        # they are playing the other side.
+        self.check_opponent(*self.get_msg())
+
+    def get_msg(self):
+        """
+        Get a message from the server. Ignores blank lines.
+        Returns a tuple of the decoded message code and the
+        rest of the message text.
+        """
+
+        while True:
+            line = next(self.fsock_in, None)
+            if line is None:
+                raise MoveError(MoveError.DISCO, "disconnected")
+            msg = self.parse_msg(line)
+            if msg is not None:
+                return msg
+    
+
+    def closeall(self):
+        """
+        Close the sockets, disconnecting from the server.
+        """
+        
+        self.fsock_out.close()
+        self.fsock_in.close()
+
+    def send(self, msg_text):
+        """
+        Send a line to the server.
+        """
+
+        print(
+            msg_text,
+            file=self.fsock_out,
+            end="\r\n",
+        )
+        self.fsock_out.flush()
+
+    def make_move(self, pos):
+        """
+        Given a position string in standard format or
+        "pass", send to the server.
+        """
+
+        self.send(self.move_line(pos))
+
+        # Get an ack from the server. If game is over
+        # shut down the connection.
+        if not self.move_ack(*self.get_msg()):
+            self.closeall()
+            return False
+
+        # Get the game status.
+        self.move_status(*self.get_msg())
+        return True
+
+
+    def get_move(self):
+        """
+        Get an opponent move from the server. Returns
+        a tuple: a boolean that is False when the
+        game is over, and the actual move string.
+        """
+
+        self.check_game_on("read move with game over")
+        return self.opp_move(*self.get_msg())
@@ -0,0 +1,293 @@
+#!/usr/bin/python3
+# Gothello server in Python, compatible with the clients in gthclient
+# and agthclient. It listens on one or more server numbers (port
+# gthclient.server_base + number) and pairs every black player with the
+# next white player on the same port, so each port can host any number
+# of games at once. The board is the referee: moves are checked with
+# Board.move_ok, two passes in a row end the game and the side with
+# more stones wins.
+#
+# Every player gets the "000" greeting, answers "<version> player
+# <side>" and is accepted with "100", or "101 <white> <black>" with the
+# clock of each side in seconds. Once both sides are there white gets
+# "351" and black "352". A move is "<serial> <move>" from black and
+# "<serial> ... <move>" from white. The mover gets "200", or "207
+# <seconds left>" with clocks, then the move status that also goes to
+# the opponent: "311 <serial> <move>" for black and "312 <serial> ...
+# <move>" for white, or 313 and 314 with the mover's seconds left
+# appended. A move that ends the game is acked with 201 (won), 202
+# (lost) or 204 (drawn) and sent to the opponent as 321/322 (black
+# moved, black/white won), 323/324 (white moved, white/black won) or
+# 327/328 (black/white moved, drawn). An illegal move gets 291 and can
+# be tried again. A player whose clock runs out loses: the opponent
+# gets 361 (black won) or 362 (white won) and the player 202. When a
+# player drops, the opponent gets 325 or 326.
+#
+# Positions and results are logged in the Gthd format that gthlog.py
+# reads.
+
+import argparse
+import asyncio
+import re
+import sys
+
+import board
+import gthclient
+from board import PLAYER_BLACK, PLAYER_WHITE, GAME_OVER
+from board import move_to_str, str_to_move
+
+VERSION = gthclient.client_version
+NAMES = {PLAYER_BLACK: "black", PLAYER_WHITE: "white"}
+LETTERS = {PLAYER_BLACK: "b", PLAYER_WHITE: "w"}
+RESULTS = {0: "Game drawn.", PLAYER_BLACK: "Black wins.",
+           PLAYER_WHITE: "White wins."}
+LINE_END = re.compile(b"[\r\n]")
+
+class Player(object):
+
+    # A connected player. Clients end lines with \r or \r\n, so lines
+    # are split on either.
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.buffer = b""
+        self.side = None
+        self.clock = None
+
+    async def readline(self):
+        while True:
+            match = LINE_END.search(self.buffer)
+            if match:
+                line = self.buffer[:match.start()]
+                self.buffer = self.buffer[match.end():]
+                if line.strip():
+                    return line.decode("utf_8", "replace")
+                continue
+            data = await self.reader.read(4096)
+            if not data:
+                raise ConnectionResetError("player disconnected")
+            self.buffer += data
+
+    def send(self, text):
+        self.writer.write((text + "\r\n").encode("utf_8"))
+
+    def close(self):
+        self.writer.close()
+
+class Match(object):
+
+    # A game between two connected players, refereed on a Board and
+    # logged through server.
+    def __init__(self, server, black, white):
+        self.server = server
+        self.players = {PLAYER_BLACK: black, PLAYER_WHITE: white}
+        self.board = board.Board()
+        self.serial = 1
+
+    async def play(self):
+        black = self.players[PLAYER_BLACK]
+        white = self.players[PLAYER_WHITE]
+        try:
+            white.send("351 black player connected")
+            black.send("352 white player connected")
+            self.log_position("b")
+            while True:
+                side = self.board.to_move
+                for player in (black, white):
+                    await player.writer.drain()
+                move = await self.get_move(side)
+                if move is None:
+                    self.time_loss(side)
+                    return
+                if self.board.try_move(move) == GAME_OVER:
+                    self.finish(side, move)
+                    return
+                self.send_move(side, move)
+                if side == PLAYER_WHITE:
+                    self.serial += 1
+                self.log_position(LETTERS[3 - side])
+        except (OSError, UnicodeError):
+            # The move text is a placeholder: the game ended without one.
+            if not black.writer.is_closing():
+                black.send("326 {} ... pass".format(self.serial))
+            if not white.writer.is_closing():
+                white.send("325 {} pass".format(self.serial))
+            self.server.write_log("Game terminated.")
+        finally:
+            for player in (black, white):
+                try:
+                    await player.writer.drain()
+                except OSError:
+                    pass
+                player.close()
+
+    def log_position(self, side):
+        rows = ["".join(".bw"[c] for c in row) for row in self.board.grid]
+        self.server.write_log("\n".join(
+            ["380 {} {}".format(self.serial, side), "382"] + rows))
+
+    # Reads moves from the player of side until a legal one arrives.
+    # Returns None when the player's clock runs out first.
+    async def get_move(self, side):
+        player = self.players[side]
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            try:
+                line = await asyncio.wait_for(player.readline(), player.clock)
+            except asyncio.TimeoutError:
+                return None
+            if player.clock is not None:
+                player.clock -= loop.time() - start
+                if player.clock <= 0:
+                    return None
+            words = line.split()
+            if side == PLAYER_WHITE and len(words) == 3 and words[1] == "...":
+                words = [words[0], words[2]]
+            move = None
+            if len(words) == 2 and words[0] == str(self.serial):
+                move = str_to_move(words[1])
+            if move is not None and not self.board.move_ok(move):
+                move = None
+            if move is None:
+                player.send("291 illegal move")
+                await player.writer.drain()
+                continue
+            return move
+
+    def move_text(self, side, move):
+        text = move_to_str(move)
+        if side == PLAYER_WHITE:
+            return "{} ... {}".format(self.serial, text)
+        return "{} {}".format(self.serial, text)
+
+    # Tells both players about a move when the game goes on.
+    def send_move(self, side, move):
+        player = self.players[side]
+        text = self.move_text(side, move)
+        if player.clock is None:
+            player.send("200 ok")
+            status = "{} {}".format(310 + side, text)
+        else:
+            seconds = int(player.clock)
+            player.send("207 {}".format(seconds))
+            status = "{} {} {}".format(312 + side, text, seconds)
+        player.send(status)
+        self.players[3 - side].send(status)
+
+    # Ends the game after the move by side that made it over.
+    def finish(self, side, move):
+        stones = self.board.score()
+        winner = (stones > 0) * PLAYER_BLACK + (stones < 0) * PLAYER_WHITE
+        if winner == 0:
+            self.players[side].send("204 game drawn")
+            code = 326 + side
+        else:
+            self.players[side].send("201 you win" if winner == side
+                                    else "202 you lose")
+            code = (321, 323)[side - 1] + (winner != side)
+        self.players[3 - side].send("{} {}".format(code, self.move_text(side, move)))
+        self.log_position("*")
+        self.server.write_log(RESULTS[winner])
+
+    # Ends the game when the clock of side runs out.
+    def time_loss(self, side):
+        winner = 3 - side
+        self.players[side].send("202 time expired")
+        self.players[winner].send("{} {} wins on time".format(
+            360 + winner, NAMES[winner]))
+        self.log_position("*")
+        self.server.write_log(RESULTS[winner])
+
+class Server(object):
+
+    # Serve games with clocks of white_time and black_time seconds, or
+    # no clocks when they are None, logging to log.
+    def __init__(self, white_time = None, black_time = None, log = sys.stdout):
+        self.white_time = white_time
+        self.black_time = black_time
+        self.log = log
+        self.waiting = {}
+        self.games = 0
+        self.playing = 0
+
+    def write_log(self, text):
+        self.log.write(text + "\n")
+        self.log.flush()
+
+    # Greets a new connection and pairs it with a waiting player of the
+    # other side on the same port.
+    async def handle(self, port, reader, writer):
+        player = Player(reader, writer)
+        try:
+            player.send("000 Gthd {} ready".format(VERSION))
+            await writer.drain()
+            words = (await player.readline()).split()
+            if len(words) != 3 or words[1] != "player" or \
+               words[2] not in ("black", "white"):
+                player.send("199 bad hello")
+                player.close()
+                return
+            player.side = PLAYER_BLACK if words[2] == "black" else PLAYER_WHITE
+            if self.white_time is None:
+                player.send("100 {} player accepted".format(words[2]))
+            else:
+                player.send("101 {} {}".format(self.white_time, self.black_time))
+                player.clock = float(self.white_time if player.side == PLAYER_WHITE
+                                     else self.black_time)
+            await writer.drain()
+        except (OSError, UnicodeError):
+            player.close()
+            return
+        self.write_log("{} player connected".format(words[2].capitalize()))
+        queue = self.waiting.setdefault((port, 3 - player.side), [])
+        while queue:
+            other = queue.pop(0)
+            if not other.reader.at_eof():
+                break
+        else:
+            self.waiting.setdefault((port, player.side), []).append(player)
+            return
+        players = {player.side: player, other.side: other}
+        self.games += 1
+        self.playing += 1
+        try:
+            await Match(self, players[PLAYER_BLACK], players[PLAYER_WHITE]).play()
+        finally:
+            self.playing -= 1
+
+    # Listens on every server number from first to first + count - 1.
+    async def serve(self, host, first, count):
+        servers = []
+        for number in range(first, first + count):
+            port = gthclient.server_base + number
+            servers.append(await asyncio.start_server(
+                lambda r, w, port=port: self.handle(port, r, w), host, port))
+        await asyncio.gather(*(server.serve_forever() for server in servers))
+
+def main():
+    parser = argparse.ArgumentParser(description="Gothello game server.")
+    parser.add_argument("server_number", type=int, nargs="?", default=0)
+    parser.add_argument("--count", type=int, default=1,
+                        help="server numbers to listen on")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--time", type=int, metavar="SECONDS",
+                        help="clock of each side")
+    parser.add_argument("--white-time", type=int, metavar="SECONDS")
+    parser.add_argument("--black-time", type=int, metavar="SECONDS")
+    parser.add_argument("--log", metavar="FILE",
+                        help="append the game log here instead of stdout")
+    args = parser.parse_args()
+    white_time = args.white_time if args.white_time is not None else args.time
+    black_time = args.black_time if args.black_time is not None else args.time
+    if (white_time is None) != (black_time is None):
+        parser.error("give both clocks or neither")
+    log = sys.stdout if args.log is None else open(args.log, "a")
+    server = Server(white_time, black_time, log)
+    try:
+        asyncio.run(server.serve(args.host, args.server_number, args.count))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
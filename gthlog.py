@@ -0,0 +1,368 @@
+#!/usr/bin/python3
+# Gthd log reader. The server logs every position as a "380 <move>
+# <side>" header, where side is b or w for the player to move or * once
+# the game is over, then a "382" line and five rows of the board, and
+# ends each game with "Black wins.", "White wins." or "Game drawn.".
+# Logs are read one line at a time, so memory stays the same whatever
+# their size. The move between two positions is found from the stone
+# that appeared, or a pass when nothing changed, and every game is
+# replayed through the board to check that the move was legal and gives
+# the logged position. Games that do not check out, such as ones cut
+# short, are counted and skipped.
+#
+# Servers that share a log file interleave their games and sometimes
+# write "Black player connected" into the middle of a board row. Every
+# position is given to the game it follows on from, and broken rows
+# are put back together.
+#
+# Checked games can be written as game records: an 8 byte magic, then
+# for every game its number in the log as an unsigned 32 bit integer,
+# the result (0 for a draw, 1 for black, 2 for white), the black minus
+# white stone count, the number of moves, and the moves themselves,
+# one byte each as in the opening book (row * 5 + column, 25 for a
+# pass).
+#
+# Running this file prints per game and per opening statistics for one
+# or more logs, optionally reading the logs in parallel.
+
+import argparse
+import concurrent.futures
+import os
+import shutil
+import struct
+import tempfile
+
+import bitboard
+import book
+import symmetry
+from board import PLAYER_BLACK, PLAYER_WHITE, PASS, move_to_str
+
+MAGIC = b"GTHREC01"
+GAME = struct.Struct("<IBbB")
+
+RESULTS = {
+    "Black wins.": PLAYER_BLACK,
+    "White wins.": PLAYER_WHITE,
+    "Game drawn.": 0,
+}
+SIDES = {"b": PLAYER_BLACK, "w": PLAYER_WHITE, "*": 0}
+CELLS = {".": 0, "b": PLAYER_BLACK, "w": PLAYER_WHITE}
+CONNECTED = ("Black player connected", "White player connected")
+
+class LogError(Exception):
+    """
+    Raised for a game whose log does not replay.
+    """
+    pass
+
+class Game(object):
+
+    # A checked game: its number in the log, moves, result and the
+    # final black minus white stone count.
+    def __init__(self, number, moves, result, stones):
+        self.number = number
+        self.moves = moves
+        self.result = result
+        self.stones = stones
+
+    def pack(self):
+        return GAME.pack(self.number, self.result, self.stones,
+                         len(self.moves)) + \
+            bytes(book.encode_move(move) for move in self.moves)
+
+# Yields the lines of a log with the connection notices taken out,
+# joining a board row that one of them was written into.
+def clean_lines(lines):
+    carry = ""
+    for line in lines:
+        line = line.rstrip("\r\n")
+        for notice in CONNECTED:
+            if line.endswith(notice):
+                carry += line[:-len(notice)]
+                line = None
+                break
+        if line is None:
+            continue
+        if carry:
+            line = carry + line
+            carry = ""
+        yield line
+
+# Yields (serial, side, grid) for every position in a log, where side
+# is the player to move or 0 once the game is over, the result string
+# after each game and None for a position that could not be read.
+def positions(lines):
+    lines = clean_lines(lines)
+    for line in lines:
+        words = line.split()
+        if line in RESULTS:
+            yield line
+        elif len(words) == 3 and words[0] == "380" and words[2] in SIDES:
+            if next(lines, None) != "382":
+                continue
+            rows = [next(lines, "") for _ in range(5)]
+            if any(len(row) != 5 or set(row) - set(CELLS) for row in rows):
+                yield None
+                continue
+            grid = [[CELLS[c] for c in row] for row in rows]
+            yield int(words[1]), SIDES[words[2]], grid
+
+# Finds the move that turns grid before into grid after for side.
+def find_move(before, after, side):
+    placed = [(i, j) for i in range(5) for j in range(5)
+              if before[i][j] == 0 and after[i][j] != 0]
+    if not placed:
+        if before != after:
+            raise LogError("stones changed without a move")
+        return PASS
+    if len(placed) > 1:
+        raise LogError("more than one stone placed")
+    i, j = placed[0]
+    if after[i][j] != side:
+        raise LogError("stone of the wrong side placed")
+    return (i, j)
+
+class OpenGame(object):
+
+    # A game being replayed, numbered in the order games start in the
+    # log.
+    def __init__(self, number):
+        self.number = number
+        self.board = bitboard.BitBoard()
+        self.moves = []
+        self.serial = 1
+        self.side = PLAYER_BLACK
+        self.over = False
+        self.idle = 0
+
+    # Checks whether the position logged as (serial, side) can come
+    # next in this game.
+    def follows(self, serial, side):
+        if self.over:
+            return False
+        if self.side == PLAYER_BLACK:
+            return serial == self.serial and side != PLAYER_BLACK
+        return (serial == self.serial + 1 and side == PLAYER_BLACK) or \
+            (serial == self.serial and side == 0)
+
+    # Plays the move that leads to grid. Raises LogError, leaving the
+    # game as it was, if no legal move does.
+    def play(self, serial, side, grid):
+        board = self.board
+        move = find_move(board.grid, grid, self.side)
+        if move != PASS and move not in board.genMoves():
+            raise LogError("illegal move")
+        board.make_move(move)
+        if board.grid != grid:
+            board.unmake_move()
+            raise LogError("position does not match the replay")
+        self.moves.append(move)
+        self.serial = serial
+        self.side = side
+        self.over = side == 0
+
+    def stones(self):
+        return self.board.score()
+
+# Positions without a game they fit before an open game is given up.
+STALE = 1000
+
+# Yields a Game for every game in a log that replays, and the string
+# "error" for every one that does not. Games from servers writing to
+# the same log can be interleaved, so every position is given to the
+# open game it follows on from.
+def games(lines):
+    open_games = []
+    waiting = []
+    started = 0
+    for item in positions(lines):
+        if item is None:
+            continue
+        if isinstance(item, str):
+            if not waiting:
+                continue
+            game = waiting.pop(0)
+            open_games.remove(game)
+            result = RESULTS[item]
+            stones = game.stones()
+            if result == (stones > 0) * PLAYER_BLACK + (stones < 0) * PLAYER_WHITE:
+                yield Game(game.number, game.moves, result, stones)
+            else:
+                yield "error"
+            continue
+        serial, side, grid = item
+        if serial == 1 and side == PLAYER_BLACK:
+            if any(grid[i][j] for i in range(5) for j in range(5)):
+                continue
+            started += 1
+            open_games.append(OpenGame(started))
+            continue
+        for game in open_games:
+            game.idle += 1
+        for game in open_games:
+            if not game.follows(serial, side):
+                continue
+            try:
+                game.play(serial, side, grid)
+            except LogError:
+                continue
+            game.idle = 0
+            if game.over:
+                waiting.append(game)
+            break
+        for game in [g for g in open_games if g.idle > STALE]:
+            open_games.remove(game)
+            if game in waiting:
+                waiting.remove(game)
+            yield "error"
+    for game in open_games:
+        yield "error"
+
+# The first plies moves of a game in the orientation that gives the
+# smallest encoding, so openings that are the same under symmetry are
+# counted together.
+def opening(moves, plies):
+    best = None
+    for s in range(8):
+        key = tuple(book.encode_move(symmetry.move_to(s, move))
+                    for move in moves[:plies])
+        if best is None or key < best:
+            best = key
+    return " ".join(move_to_str(book.decode_move(n)) for n in best)
+
+class Stats(object):
+
+    # Counts for a set of games, merged across logs.
+    def __init__(self):
+        self.games = 0
+        self.errors = 0
+        self.results = [0, 0, 0]
+        self.moves = 0
+        self.passes = 0
+        self.openings = {}
+
+    def add(self, game, plies):
+        self.games += 1
+        self.results[game.result] += 1
+        self.moves += len(game.moves)
+        self.passes += game.moves.count(PASS)
+        key = opening(game.moves, plies)
+        counts = self.openings.setdefault(key, [0, 0, 0])
+        counts[game.result] += 1
+
+    def merge(self, other):
+        self.games += other.games
+        self.errors += other.errors
+        for i in range(3):
+            self.results[i] += other.results[i]
+        self.moves += other.moves
+        self.passes += other.passes
+        for key, counts in other.openings.items():
+            mine = self.openings.setdefault(key, [0, 0, 0])
+            for i in range(3):
+                mine[i] += counts[i]
+
+    def report(self, top):
+        draws, black, white = self.results
+        print("games: {} errors: {}".format(self.games, self.errors))
+        print("black wins: {} white wins: {} draws: {}".format(
+            black, white, draws))
+        print("moves per game: {:.1f} passes per game: {:.2f}".format(
+            self.moves / max(self.games, 1), self.passes / max(self.games, 1)))
+        openings = sorted(self.openings.items(), key=lambda item: -sum(item[1]))
+        for key, (draws, black, white) in openings[:top]:
+            games = draws + black + white
+            print("{:<20} games: {:3} black: {:.0%} white: {:.0%} draws: {:.0%}".format(
+                key, games, black / games, white / games, draws / games))
+
+# Reads one log. Writes the records of its games to record_path if it
+# is set and returns the Stats.
+def read_log(path, plies, record_path = None, verbose = False):
+    stats = Stats()
+    records = None
+    if record_path is not None:
+        records = open(record_path, "wb")
+    try:
+        with open(path, encoding="utf_8", errors="replace") as f:
+            for game in games(f):
+                if game == "error":
+                    stats.errors += 1
+                    continue
+                stats.add(game, plies)
+                if records is not None:
+                    records.write(game.pack())
+                if verbose:
+                    print("{} game {}: {} moves, {} by {}".format(
+                        path, game.number, len(game.moves),
+                        ("draw", "black", "white")[game.result],
+                        abs(game.stones)))
+    finally:
+        if records is not None:
+            records.close()
+    return stats
+
+# Yields the Game records in a record file.
+def read_records(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{}: not a game record file".format(path))
+        while True:
+            header = f.read(GAME.size)
+            if not header:
+                return
+            number, result, stones, count = GAME.unpack(header)
+            moves = [book.decode_move(n) for n in f.read(count)]
+            yield Game(number, moves, result, stones)
+
+# Reads the logs, in a pool of jobs processes when jobs > 1, and writes
+# all their games to output in the order of the logs.
+def read_logs(paths, plies, output = None, jobs = 1, verbose = False):
+    parts = [None] * len(paths)
+    if output is not None:
+        directory = os.path.dirname(os.path.abspath(output))
+        for i in range(len(paths)):
+            fd, parts[i] = tempfile.mkstemp(dir=directory)
+            os.close(fd)
+    stats = Stats()
+    try:
+        if jobs > 1:
+            with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+                futures = [pool.submit(read_log, path, plies, part, verbose)
+                           for path, part in zip(paths, parts)]
+                for future in futures:
+                    stats.merge(future.result())
+        else:
+            for path, part in zip(paths, parts):
+                stats.merge(read_log(path, plies, part, verbose))
+        if output is not None:
+            with open(output, "wb") as out:
+                out.write(MAGIC)
+                for part in parts:
+                    with open(part, "rb") as f:
+                        shutil.copyfileobj(f, out)
+    finally:
+        for part in parts:
+            if part is not None:
+                os.unlink(part)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Read and check Gthd logs.")
+    parser.add_argument("logs", nargs="+")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write the checked games as game records")
+    parser.add_argument("--opening", type=int, default=2, metavar="PLIES",
+                        help="moves that make up an opening")
+    parser.add_argument("--top", type=int, default=10,
+                        help="openings to show")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="logs read at the same time")
+    parser.add_argument("--games", action="store_true",
+                        help="print every game")
+    args = parser.parse_args()
+    stats = read_logs(args.logs, args.opening, args.output, args.jobs,
+                      args.games)
+    stats.report(args.top)
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,225 @@
 #!/usr/bin/python3
 
-import sys
+import argparse
+import cProfile
+import json
+import time
 import gthclient
 import board
-import table
+from board import move_to_str, str_to_move
+import book
+import endgame
+import mcts
+import parallel
+import pattern
+import search
 
 class Player(object):
 
-    # Initalize variables for the game
-    def __init__(self, depth, client):
-        self.board = board.Board()
-        self.table = table.Table()
+    # Initalize variables for the game. The search with its
+    # transposition table and history, the process pool and the books
+    # are kept for every game the player plays; the board and client
+    # are set up again by new_game.
+    def __init__(self, depth, client, engine="grid", hash_mb=16, workers=1,
+                 parallel_kind="root", ponder=False, book_path=None,
+                 endgame_empties=0, endgame_path=None, symmetric=False,
+                 stats_log=None, profile_path=None, profile_move=0,
+                 search_kind="negamax", quiescence=0, patterns_path=None,
+                 playouts=5000):
+        self.engine = engine
+        self.search = parallel.make_search(hash_mb, workers, parallel_kind)
+        self.search.symmetry = symmetric
+        self.search.pvs = search_kind == "pvs"
+        self.search.quiescence = quiescence
+        if patterns_path is not None:
+            self.search.patterns = pattern.load(patterns_path)
+        self.table = self.search.table
+        self.mcts = None
+        if search_kind == "mcts":
+            self.mcts = mcts.Mcts()
+        self.playouts = playouts
+        # Root parallel workers keep their own tables and never read the
+        # one pondering fills.
+        if ponder and isinstance(self.search.pool, parallel.RootPool):
+            print("pondering is off: it does not help --parallel root")
+            ponder = False
+        self.ponder = ponder
+        self.pondering = None
+        self.book = None
+        if book_path is not None:
+            self.book = book.Book(book_path)
+        self.endgame_empties = endgame_empties
+        self.solver = endgame.Solver()
+        self.endgame_table = None
+        if endgame_path is not None:
+            self.endgame_table = book.Book(endgame_path, endgame.MAGIC)
         self.depth = depth
+        self.games = 0
+        self.new_game(client)
+        self.stats_log = None
+        if stats_log is not None:
+            self.stats_log = open(stats_log, "a")
+        self.profile_path = profile_path
+        self.profile_move = profile_move
+        self.profiler = None
+        if profile_path is not None:
+            self.profiler = cProfile.Profile()
+
+    # Start a game on client with an empty board.
+    def new_game(self, client):
+        self.board = search.ENGINES[self.engine]()
         self.client = client
         self.count = 0
+        self.games += 1
+
+    # Seconds to spend on this move, or None when the game has no clock.
+    def time_budget(self):
+        if self.client.my_time is None:
+            return None
+        return search.move_budget(self.client.my_time, self.board.empty_count())
+
+    # Checks a move from a book or table before it is played.
+    def legal_move(self, move):
+        return move == board.PASS or move in self.board.genMoves()
 
-    # Gets a range of letters and numbers, supplied by Bart Massey
-    # https://github.com/pdx-cs-ai/gothello-libclient-python3
-    def letter_range(self, letter):
-        for i in range(5):
-            yield chr(ord(letter) + i)
-
-    # Converts a move from a tuple to a string in order to be
-    # read by the game server
-    def convert_move_to_str(self, move):
-        if move == (-1,-1):
-            return "pass"
-        for i, letter in zip(range(5), self.letter_range('a')):
-            for j in range(5):
-                if move[0] == i and move[1] == j:
-                    move_str = letter + str(j+1)
-        return move_str
-
-    # Converts a move from a string to a tuple in order to be
-    # read by the code that makes the moves.
-    def convert_move_to_tuple(self, move):
-        if move == "pass":
-            return (-1,-1)
-        for i, letter in zip(range(5), self.letter_range('a')):
-            for digit in self.letter_range('1'):
-                if move[0] == letter and move[1] == digit:
-                    move_tup = (i, int(digit)-1)
-        return move_tup
+    # Returns the book move for the current position if there is a
+    # legal one.
+    def book_move(self):
+        if self.book is None:
+            return None
+        move = self.book.probe(self.board)
+        if move is None or not self.legal_move(move):
+            return None
+        return move
+
+    # Returns the perfect play move once few enough points are empty,
+    # from the endgame table if it has the position or else from the
+    # solver. Returns None if the solver runs out of time.
+    def endgame_move(self, budget):
+        board = self.board
+        if board.empty_count() > self.endgame_empties:
+            return None
+        # A table hit searches no nodes.
+        self.solver.nodes = 0
+        if self.endgame_table is not None:
+            move = self.endgame_table.probe(board)
+            if move is not None and self.legal_move(move):
+                return move
+        self.solver.search = self.search
+        if budget is not None:
+            self.search.deadline = time.time() + budget
+        root = len(board.undo)
+        try:
+            move, value = self.solver.best_move(board)
+        except search.SearchTimeout:
+            while len(board.undo) > root:
+                board.unmake_move()
+            return None
+        finally:
+            self.search.deadline = None
+        print("solved: {} in {} nodes".format(value, self.solver.nodes))
+        return move
 
     # Finds the player's best move and sends it to the server.
+    # Book moves and solved endgames are played without searching. Without a clock the
+    # search goes to the fixed depth, otherwise it deepens until the
+    # time budget for the move runs out. The endgame solver gets half of
+    # the budget and the search whatever the solver left of it.
     def make_player_move(self):
         board = self.board
-        board.find_best_move(self, self.depth)
+        self.count += 1
+        empty = board.empty_count()
+        start = time.time()
+        budget = self.time_budget()
+        source = "book"
+        move = self.book_move()
+        if move is None:
+            source = "endgame"
+            move = self.endgame_move(None if budget is None else budget / 2)
+        if move is not None:
+            board.best_move = move
+            stats = search.SearchStats(source)
+            stats.move = move
+            if source == "endgame":
+                stats.nodes = self.solver.nodes
+        else:
+            left = budget
+            if budget is not None:
+                left = max(budget - (time.time() - start), 0.0)
+            engine = self.search if self.mcts is None else self.mcts
+            if self.profile_move in (0, self.count):
+                engine.profiler = self.profiler
+            try:
+                if self.mcts is not None:
+                    self.mcts.iterate(board, self.playouts, left)
+                elif budget is None:
+                    self.search.iterate(board, self.depth)
+                else:
+                    self.search.iterate(board, search.MAX_DEPTH, left)
+            finally:
+                engine.profiler = None
+            stats = engine.stats
+        elapsed = time.time() - start
+        stats.time = elapsed
         board.try_move(board.best_move)
-        best_move = self.convert_move_to_str(board.best_move)
+        best_move = move_to_str(board.best_move)
         print("me:", best_move)
+        self.print_stats(stats)
+        self.log_stats(stats, best_move, empty, budget)
+        # Pondering fills the alpha-beta table, which MCTS does not use.
+        if self.ponder and self.mcts is None:
+            self.pondering = search.Ponder(self.search, board)
         return self.client.make_move(best_move)
 
+    def print_stats(self, stats):
+        if stats.source == "mcts":
+            print("playouts: {} playouts/s: {:.0f} tree: {} nodes depth {} "
+                  "win rate: {}%".format(
+                stats.playouts, stats.playouts_per_second(), stats.nodes,
+                stats.depth, stats.value))
+            return
+        print("depth: {} nodes: {} qnodes: {} nps: {:.0f} branching: {:.2f}".format(
+            stats.depth, stats.nodes, stats.qnodes, stats.nps(),
+            stats.branching_factor()))
+        print("cutoffs: {} first move: {:.1%} researches: {}".format(
+            stats.cutoffs, stats.first_cutoff_rate(), stats.researches))
+        t = self.table
+        print("tt: {:.1%} full, {} probes, {:.1%} hits, {} collisions".format(
+            t.occupancy(), stats.tt_probes, stats.tt_hit_rate(), t.collisions))
+
+    # Writes one JSON line about the move to the stats log.
+    def log_stats(self, stats, move, empty, budget):
+        if self.stats_log is None:
+            return
+        record = {
+            "game": self.games,
+            "color": self.client.who,
+            "count": self.count,
+            "played": move,
+            "empty": empty,
+            "clock": self.client.my_time,
+            "budget": budget,
+        }
+        record.update(stats.as_dict())
+        self.stats_log.write(json.dumps(record) + "\n")
+        self.stats_log.flush()
+
+    # Stops pondering, if we are, before the board changes.
+    def stop_pondering(self):
+        if self.pondering is not None:
+            print("ponder nodes:", self.pondering.stop())
+            self.pondering = None
+
     # Gets the opponents move and updates the game board.
     def get_opp_move(self):
-        cont, move = self.client.get_move()
+        try:
+            cont, move = self.client.get_move()
+        finally:
+            self.stop_pondering()
         if not cont:
             return False
         print("opp:", move)
-        move = self.convert_move_to_tuple(move)
+        move = str_to_move(move)
         self.board.try_move(move)
         return True
         
@@ -77,20 +238,118 @@ class Player(object):
             else:
                 if not self.get_opp_move():
                     break
+        self.stop_pondering()
         if self.client.winner == "black":
             print("black win")
         if self.client.winner == "white":
             print("white win")
+        if self.client.winner == "draw":
+            print("draw")
+
+    # Release the pool, books and logs once no more games will be played.
+    def close(self):
+        self.stop_pondering()
+        if self.search.pool is not None:
+            self.search.pool.close()
+        if self.book is not None:
+            self.book.close()
+        if self.endgame_table is not None:
+            self.endgame_table.close()
+        if self.stats_log is not None:
+            self.stats_log.close()
+        if self.profiler is not None:
+            self.profiler.dump_stats(self.profile_path)
+            print("profile written to", self.profile_path)
+
+# Connects to the server, trying again every retry seconds while it
+# cannot be reached when retry is set.
+def connect(args, retry = None):
+    while True:
+        try:
+            return gthclient.GthClient(args.color, args.server_name,
+                                       args.server_number)
+        except (OSError, gthclient.ClientError) as e:
+            if retry is None:
+                raise
+            print("connect failed: {}".format(getattr(e, "message", e)))
+            time.sleep(retry)
+
+def main():
+    parser = argparse.ArgumentParser(description="Gothello negamax player.")
+    parser.add_argument("color", choices=["black", "white"])
+    parser.add_argument("server_name")
+    parser.add_argument("server_number", type=int)
+    parser.add_argument("depth", type=int)
+    parser.add_argument("--engine", choices=sorted(search.ENGINES), default="grid",
+                        help="board implementation used by the search")
+    parser.add_argument("--search", choices=["negamax", "pvs", "mcts"],
+                        default="negamax",
+                        help="plain alpha-beta, principal variation search "
+                             "with aspiration windows, or Monte Carlo tree "
+                             "search, which ignores depth")
+    parser.add_argument("--playouts", type=int, default=5000,
+                        help="MCTS playouts per move when there is no clock")
+    parser.add_argument("--quiescence", type=int, default=0, metavar="NODES",
+                        help="search captures past the horizon, at most NODES "
+                             "nodes for each horizon position")
+    parser.add_argument("--patterns", metavar="FILE",
+                        help="evaluate leaves with pattern weights fitted by "
+                             "pattern.py instead of the stone count")
+    parser.add_argument("--hash", type=int, default=16, metavar="MB",
+                        help="transposition table size in MB")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes searching in parallel")
+    parser.add_argument("--parallel", choices=["root", "smp"], default="root",
+                        help="split root moves over the workers, or run a lazy "
+                             "SMP search over a shared transposition table")
+    parser.add_argument("--ponder", action="store_true",
+                        help="search on the opponent's time")
+    parser.add_argument("--symmetry", action="store_true",
+                        help="share table entries between mirrored and rotated "
+                             "positions")
+    parser.add_argument("--book", metavar="FILE",
+                        help="opening book built with book.py")
+    parser.add_argument("--endgame", type=int, default=0, metavar="EMPTIES",
+                        help="solve the game exactly once this few points are empty")
+    parser.add_argument("--endgame-table", metavar="FILE",
+                        help="solved positions built with endgame.py")
+    parser.add_argument("--stats-log", metavar="FILE",
+                        help="append one JSON line per move with the search "
+                             "numbers")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run the searches under cProfile and save the "
+                             "profile")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep playing games, reconnecting after each one "
+                             "with the table, history and books kept warm")
+    parser.add_argument("--games", type=int, default=0, metavar="N",
+                        help="in daemon mode stop after N games")
+    parser.add_argument("--retry", type=float, default=1.0, metavar="SECONDS",
+                        help="in daemon mode wait this long before connecting "
+                             "again")
+    parser.add_argument("--profile-move", type=int, default=0, metavar="N",
+                        help="profile only our Nth move")
+    args = parser.parse_args()
+    retry = args.retry if args.daemon else None
+    p = Player(args.depth, connect(args, retry), args.engine, args.hash,
+               args.workers, args.parallel, args.ponder, args.book,
+               args.endgame, args.endgame_table, args.symmetry,
+               args.stats_log, args.profile, args.profile_move, args.search,
+               args.quiescence, args.patterns, args.playouts)
+    try:
+        while True:
+            try:
+                p.play()
+            except (OSError, gthclient.ClientError) as e:
+                if not args.daemon:
+                    raise
+                print("game failed: {}".format(getattr(e, "message", e)))
+                p.stop_pondering()
+            if not args.daemon or p.games == args.games:
+                break
+            p.new_game(connect(args, retry))
+    finally:
+        p.close()
 
-def usage():
-    print("usage: python3 gthplayer.py color server_name server_number depth")
-    exit(0)
-
-if len(sys.argv) != 5: usage()
-my_color = sys.argv[1]
-server_name = sys.argv[2]
-server_number = int(sys.argv[3])
-depth = int(sys.argv[4])
-client = gthclient.GthClient(my_color, server_name, server_number)
-p = Player(depth, client)
-p.play()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+# Monte Carlo tree search. Every playout walks down the tree choosing
+# children by UCT, adds the children of the leaf it reaches, plays
+# random moves from there to the end of the game and counts the result
+# back up the path. The move played is the root child with the most
+# visits.
+#
+# The tree lives in a node pool: parallel arrays indexed by node
+# number, allocated once, so a search makes no Python object per node.
+# The children of a node are next to each other in the pool. When the
+# pool is full the leaves stop growing and the search carries on with
+# playouts alone.
+#
+# Positions inside the search are just the stones of the side to move
+# and of its opponent as two bitboard integers, so playouts need no
+# board copies: a move is a few masks and a flood fill of the groups
+# next to it.
+#
+# Running this file times playouts and searches on the empty board.
+
+import argparse
+import array
+import math
+import random
+import time
+
+import search
+from bitboard import BIT, FULL, NEIGHBORS, MOVES, expand, flood
+from board import PASS
+
+# Move number of a pass in the pool, after the 25 points.
+PASS_MOVE = 25
+
+# Nodes in the pool.
+NODES = 1 << 18
+
+# UCT exploration constant.
+EXPLORATION = 1.0
+
+# Playouts between looks at the clock.
+CHECK_EVERY = 64
+
+# Returns the mask of legal points for the side with stones own. A
+# point with an empty neighbour is always legal; any other needs its
+# group to keep a liberty.
+def legal_moves(own, opp):
+    empty = FULL & ~(own | opp)
+    result = empty & expand(empty)
+    rest = empty & ~result
+    while rest:
+        bit = rest & -rest
+        rest ^= bit
+        if expand(flood(bit, own | bit)) & empty & ~bit:
+            result |= bit
+    return result
+
+# Plays point n for the side with stones own. Opponent groups left
+# without a liberty change color. Returns the new own and opp.
+def play(own, opp, n):
+    own |= BIT[n]
+    empty = FULL & ~(own | opp)
+    adjacent = NEIGHBORS[n] & opp
+    while adjacent:
+        group = flood(adjacent & -adjacent, opp)
+        adjacent &= ~group
+        if not expand(group) & empty:
+            opp &= ~group
+            own |= group
+    return own, opp
+
+# Plays random legal moves until two passes in a row. Returns 1, 0.5
+# or 0 for a win, draw or loss of the side to move at the start.
+def playout(own, opp, passes, rng):
+    sign = 1
+    randrange = rng.randrange
+    while passes < 2:
+        moves = legal_moves(own, opp)
+        if moves:
+            for _ in range(randrange(moves.bit_count())):
+                moves &= moves - 1
+            own, opp = play(own, opp, (moves & -moves).bit_length() - 1)
+            passes = 0
+        else:
+            passes += 1
+        own, opp = opp, own
+        sign = -sign
+    stones = sign * (own.bit_count() - opp.bit_count())
+    if stones > 0:
+        return 1.0
+    if stones < 0:
+        return 0.0
+    return 0.5
+
+class Mcts(object):
+
+    # Allocate a pool of nodes. Each node has its move, the first of
+    # its children and their number (-1 until the node is expanded),
+    # its visits, and the playouts won by the side that moved into it.
+    def __init__(self, nodes = NODES, exploration = EXPLORATION, seed = None):
+        self.size = nodes
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.move = array.array("b", bytes(nodes))
+        self.first = array.array("i", bytes(4 * nodes))
+        self.count = array.array("b", bytes(nodes))
+        self.visits = array.array("i", bytes(4 * nodes))
+        self.wins = array.array("d", bytes(8 * nodes))
+        self.used = 0
+        self.playouts = 0
+        self.depth = 0
+        self.stats = search.SearchStats("mcts")
+        self.profiler = None
+
+    def new_node(self, move):
+        n = self.used
+        self.used += 1
+        self.move[n] = move
+        self.count[n] = -1
+        self.visits[n] = 0
+        self.wins[n] = 0.0
+        return n
+
+    # Adds a child for every legal move, or a pass when there are none.
+    # Returns False when the pool has no room.
+    def expand(self, node, own, opp):
+        moves = legal_moves(own, opp)
+        count = moves.bit_count() or 1
+        if self.used + count > self.size:
+            return False
+        self.first[node] = self.used
+        self.count[node] = count
+        if not moves:
+            self.new_node(PASS_MOVE)
+        while moves:
+            bit = moves & -moves
+            moves ^= bit
+            self.new_node(bit.bit_length() - 1)
+        return True
+
+    # The child of node with the best UCT score. Unvisited children
+    # come first.
+    def select(self, node):
+        first = self.first[node]
+        visits = self.visits
+        wins = self.wins
+        scale = self.exploration * math.sqrt(math.log(visits[node] or 1))
+        best = first
+        best_score = -1.0
+        for child in range(first, first + self.count[node]):
+            n = visits[child]
+            if n == 0:
+                return child
+            score = wins[child] / n + scale / math.sqrt(n)
+            if score > best_score:
+                best_score = score
+                best = child
+        return best
+
+    # Runs one playout from the root position.
+    def run_playout(self, own, opp, passes):
+        node = 0
+        path = [0]
+        while self.count[node] > 0 and passes < 2:
+            node = self.select(node)
+            path.append(node)
+            move = self.move[node]
+            if move == PASS_MOVE:
+                passes += 1
+            else:
+                own, opp = play(own, opp, move)
+                passes = 0
+            own, opp = opp, own
+        if passes < 2 and self.visits[node] > 0 and self.expand(node, own, opp):
+            node = self.first[node]
+            path.append(node)
+            move = self.move[node]
+            if move == PASS_MOVE:
+                passes += 1
+            else:
+                own, opp = play(own, opp, move)
+                passes = 0
+            own, opp = opp, own
+        self.depth = max(self.depth, len(path) - 1)
+        # result is for the side to move at the leaf; each node counts
+        # wins for the side that moved into it.
+        result = 1.0 - playout(own, opp, passes, self.rng)
+        visits = self.visits
+        wins = self.wins
+        for node in reversed(path):
+            visits[node] += 1
+            wins[node] += result
+            result = 1.0 - result
+        self.playouts += 1
+
+    # Searches board with playouts playouts, or until budget seconds
+    # have passed when budget is set. Returns the most visited move and
+    # leaves the numbers of the search in self.stats, with the win rate
+    # of that move as its value in percent. Like Search.iterate it runs
+    # under profiler when one is set.
+    def iterate(self, board, playouts, budget = None):
+        if self.profiler is None:
+            return self.run(board, playouts, budget)
+        self.profiler.enable()
+        try:
+            return self.run(board, playouts, budget)
+        finally:
+            self.profiler.disable()
+
+    def run(self, board, playouts, budget):
+        start = time.time()
+        deadline = None if budget is None else start + budget
+        own, opp = board.masks()
+        passes = 1 if board.previous_move == PASS else 0
+        self.used = 0
+        self.playouts = 0
+        self.depth = 0
+        self.new_node(PASS_MOVE)
+        self.expand(0, own, opp)
+        while True:
+            if deadline is None:
+                if self.playouts >= playouts:
+                    break
+            elif not self.playouts % CHECK_EVERY and self.playouts and \
+                 time.time() > deadline:
+                break
+            self.run_playout(own, opp, passes)
+        first = self.first[0]
+        best = max(range(first, first + self.count[0]),
+                   key=lambda child: self.visits[child])
+        move = self.move[best]
+        move = PASS if move == PASS_MOVE else MOVES[move]
+        board.best_move = move
+        stats = search.SearchStats("mcts")
+        stats.move = move
+        stats.value = round(100 * self.wins[best] / max(self.visits[best], 1))
+        stats.depth = self.depth
+        stats.nodes = self.used
+        stats.playouts = self.playouts
+        stats.time = time.time() - start
+        self.stats = stats
+        return move
+
+def main():
+    parser = argparse.ArgumentParser(description="Time MCTS playouts.")
+    parser.add_argument("--playouts", type=int, default=5000)
+    parser.add_argument("--time", type=float, default=None, metavar="SECONDS",
+                        help="search against the clock instead")
+    args = parser.parse_args()
+    rng = random.Random(0)
+    start = time.time()
+    for _ in range(args.playouts):
+        playout(0, 0, 0, rng)
+    elapsed = time.time() - start
+    print("bare playouts: {:.0f}/s".format(args.playouts / elapsed))
+    mcts = Mcts(seed=0)
+    move = mcts.iterate(search.ENGINES["bitboard"](), args.playouts, args.time)
+    stats = mcts.stats
+    print("search: {} playouts {:.0f}/s, {} nodes, depth {}, move {} at {}%".format(
+        stats.playouts, stats.playouts_per_second(), stats.nodes, stats.depth,
+        move, stats.value))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+# Parallel searches over a process pool that is started once and kept
+# warm for the whole game.
+#
+# RootPool searches every root move with a full window in a worker
+# process, the same way Board.find_best_move searches them one after
+# the other. Every worker keeps its own transposition table.
+#
+# SmpPool is a lazy SMP search. Helper processes run iterative
+# deepening on the same root at staggered depths while the main
+# process searches as usual, and they all share one SharedTable. The
+# helpers only fill the table; the move comes from the main search.
+
+import argparse
+import concurrent.futures
+import time
+
+import bitboard
+import search
+import table
+from board import INF, PASS
+
+# Search state of a worker process, set up by init_worker or
+# init_helper.
+worker = None
+
+def init_worker(hash_mb):
+    global worker
+    worker = search.Search(table.Table(hash_mb))
+
+class HelperSearch(search.Search):
+
+    # Helpers also stop when the main process raises the stop flag.
+    def check_time(self):
+        if self.table.stopped():
+            raise search.SearchTimeout()
+        search.Search.check_time(self)
+
+def init_helper(name):
+    global worker
+    worker = HelperSearch(table.SharedTable(name=name))
+
+# Iterative deepening in a helper process. Odd helpers start one ply
+# deeper than even ones so the processes do not all search the same
+# tree at the same time. Returns the nodes searched.
+def helper_search(position, options, max_depth, deadline, index):
+    worker.set_options(options)
+    worker.nodes = 0
+    worker.deadline = deadline
+    try:
+        for depth in range(1 + index % 2, max_depth + 1):
+            position.find_best_move(worker, depth)
+    except search.SearchTimeout:
+        pass
+    return worker.nodes
+
+# Searches one root move in a worker process. Returns the value of the
+# move, or None when the deadline passed, and the nodes searched.
+def search_move(position, options, move, depth, deadline):
+    worker.set_options(options)
+    worker.nodes = 0
+    worker.deadline = deadline
+    status = position.try_move(move)
+    try:
+        value = -position.negamax(worker, depth, status, -INF, INF, 1)
+    except search.SearchTimeout:
+        return None, worker.nodes
+    return value, worker.nodes
+
+# Starts count processes in executor and waits for them. Each task
+# sleeps briefly so that no process is free to take a second one, and
+# the pool has to start a new process for every task.
+def warm_up(executor, count):
+    futures = [executor.submit(time.sleep, 0.1) for _ in range(count)]
+    for future in futures:
+        future.result()
+
+class RootPool(object):
+
+    # Start the worker processes. Each gets a table of hash_mb megabytes.
+    def __init__(self, workers, hash_mb = 16):
+        self.workers = workers
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            workers,
+            initializer=init_worker,
+            initargs=(hash_mb,),
+        )
+
+    # Start every worker process, and so allocate its table, ahead of
+    # the first search.
+    def warm(self):
+        warm_up(self.executor, self.workers)
+
+    # Nothing to set up around a search.
+    def start(self, search_state, board, max_depth, deadline):
+        pass
+
+    def stop(self):
+        return 0
+
+    # Searches every root move in the pool and sets board.best_move
+    # with the same tie breaking as Board.find_best_move. Raises
+    # SearchTimeout when any move ran out of time.
+    def find_best_move(self, search_state, board, depth):
+        moves = board.genMoves()
+        if not moves:
+            board.best_move = PASS
+            board.best_value = board.heval()
+            return
+        options = search_state.options()
+        futures = [self.executor.submit(search_move, board, options, move,
+                                        depth, search_state.deadline)
+                   for move in moves]
+        values = []
+        try:
+            for future in futures:
+                value, nodes = future.result()
+                search_state.nodes += nodes
+                if value is None:
+                    raise search.SearchTimeout()
+                values.append(value)
+        finally:
+            for future in futures:
+                future.cancel()
+        board.pick_best_move(moves, values)
+
+    # Stop the worker processes.
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+class SmpPool(object):
+
+    # Start helpers - 1 helper processes attached to shared_table. The
+    # main process is the last searcher.
+    def __init__(self, workers, shared_table):
+        self.workers = workers
+        self.table = shared_table
+        self.futures = []
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            workers - 1,
+            initializer=init_helper,
+            initargs=(shared_table.name,),
+        )
+
+    # Start every helper process ahead of the first search.
+    def warm(self):
+        warm_up(self.executor, self.workers - 1)
+
+    # Start the helpers on the root position.
+    def start(self, search_state, board, max_depth, deadline):
+        self.table.set_stop(False)
+        options = search_state.options()
+        self.futures = [self.executor.submit(helper_search, board, options,
+                                             max_depth, deadline, i)
+                        for i in range(self.workers - 1)]
+
+    # The main process searches the root itself.
+    def find_best_move(self, search_state, board, depth):
+        board.find_best_move(search_state, depth)
+
+    # Stop the helpers and return the nodes they searched.
+    def stop(self):
+        self.table.set_stop(True)
+        nodes = sum(future.result() for future in self.futures)
+        self.futures = []
+        return nodes
+
+    # Stop the helper processes and free the shared table.
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.table.close()
+
+# Times a fixed depth search of an early position with 1 to N workers.
+# The pools are warmed up first so process start up is not timed.
+def main():
+    parser = argparse.ArgumentParser(description="Parallel search scaling test.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--parallel", choices=["root", "smp"], default="root")
+    args = parser.parse_args()
+    for workers in range(1, args.workers + 1):
+        board = bitboard.BitBoard()
+        for move in [(2, 2), (1, 2), (2, 1)]:
+            board.try_move(move)
+        state = make_search(16, workers, args.parallel)
+        if state.pool is not None:
+            state.pool.warm()
+        start = time.time()
+        state.iterate(board, args.depth)
+        elapsed = time.time() - start
+        if workers == 1:
+            serial = elapsed
+        print("workers: {} time: {:.2f}s speedup: {:.2f}".format(
+            workers, elapsed, serial / elapsed))
+        if state.pool is not None:
+            state.pool.close()
+
+# Builds a Search with a pool of the given kind when workers > 1.
+def make_search(hash_mb, workers, kind):
+    if workers > 1 and kind == "smp":
+        shared_table = table.SharedTable(hash_mb)
+        search_state = search.Search(shared_table)
+        search_state.pool = SmpPool(workers, shared_table)
+    else:
+        search_state = search.Search(table.Table(hash_mb))
+        if workers > 1:
+            search_state.pool = RootPool(workers, hash_mb)
+    return search_state
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+#!/usr/bin/python3
+# Pattern evaluation. A position is scored for the side to move as the
+# sum of table entries for the pattern of every row and column, each
+# one of 3^5 = 243 ways to fill five points with empty, own and
+# opponent stones, and of the 2x2 region in every corner (3^4 = 81
+# patterns), plus weights for the difference in liberties, the empty
+# points next to stones of each side, and in eyes, the empty points
+# with only stones of one side around them. Since points next to both
+# sides cancel out, the liberty difference is also the difference in
+# territory each side could claim. The patterns see the shape and
+# safety of groups along each line and in the corners, where stones
+# are easiest to capture.
+#
+# Rows and columns the same distance from the edge share a table, so
+# there are three line tables: edge, second line and middle. Patterns
+# that mirror each other share an entry. The weights are fitted to
+# predict the final black minus white stone count from the side to
+# move's point of view, so the value is in stones like heval and is
+# compared directly with the value of finished games. The tables start
+# out as the stone count, which every point adds to its row and its
+# column at half weight.
+#
+# Every lookup table is indexed by the own and opponent stones of a
+# line together, so on a bitboard a leaf costs fourteen lookups and a
+# few popcounts instead of a walk over the grid.
+#
+# Running this file fits the weights by stochastic gradient descent on
+# the positions of self-play games, and of game records written by
+# gthlog.py, then writes them to a file for gthplayer.py --patterns.
+#
+# File layout: an 8 byte magic, then every weight as a 32 bit float:
+# the three line tables, the corner table, the liberty weight and the
+# eye weight.
+
+import argparse
+import array
+import concurrent.futures
+import random
+import time
+
+import bitboard
+import gthlog
+import search
+import table
+from bitboard import COL_0, FULL, expand
+from board import PLAYER_BLACK, GAME_OVER, PASS
+
+MAGIC = b"GTHPAT01"
+
+LINE = 243
+CORNER = 81
+LINES = 3
+CORNER_BASE = LINES * LINE
+LIBERTIES = CORNER_BASE + CORNER
+EYES = LIBERTIES + 1
+WEIGHTS = EYES + 1
+
+# Line table of each row or column.
+LINE_CLASS = [0, 1, 2, 1, 0]
+
+# Moves the column bits 0, 5, 10, 15 and 20 to bits 20 to 24.
+COLUMN_MAGIC = (1 << 20) | (1 << 16) | (1 << 12) | (1 << 8) | (1 << 4)
+
+# Base 3 value of a five bit line with every set bit a 1.
+TERNARY = [sum(3 ** k for k in range(5) if x & (1 << k)) for x in range(32)]
+
+# Row codes are own << 5 | opp. HALF gives the two points of a row at
+# the left end (columns 0 and 1) or the right end (columns 4 and 3),
+# corner column first, as own | opp << 2. A corner region is the corner
+# point, the point next to it along the row, then along the column,
+# then the diagonal one, and its code is the HALF of the corner row
+# with the HALF of the next row above it.
+def half(code, end):
+    o = code >> 5
+    p = code & 31
+    if end:
+        o = ((o >> 4) & 1) | ((o >> 2) & 2)
+        p = ((p >> 4) & 1) | ((p >> 2) & 2)
+    else:
+        o &= 3
+        p &= 3
+    return o | p << 2
+
+HALF = [[half(code, end) for code in range(1024)] for end in range(2)]
+
+# The corners as (row, next row, end).
+CORNERS = [(0, 1, 0), (0, 1, 1), (4, 3, 0), (4, 3, 1)]
+
+# Base 3 pattern of a corner code, or None when it puts two stones on
+# one point.
+def corner_pattern(code):
+    o = (code & 3) | ((code >> 4) & 3) << 2
+    p = ((code >> 2) & 3) | ((code >> 6) & 3) << 2
+    if o & p:
+        return None
+    return TERNARY[o] + 2 * TERNARY[p]
+
+def reverse_line(t):
+    digits = [(t // 3 ** k) % 3 for k in range(5)]
+    return sum(d * 3 ** (4 - k) for k, d in enumerate(digits))
+
+def transpose_corner(t):
+    digits = [(t // 3 ** k) % 3 for k in range(4)]
+    digits[1], digits[2] = digits[2], digits[1]
+    return sum(d * 3 ** k for k, d in enumerate(digits))
+
+# The shared entry of every line and corner pattern.
+LINE_KEY = [min(t, reverse_line(t)) for t in range(LINE)]
+CORNER_KEY = [min(t, transpose_corner(t)) for t in range(CORNER)]
+
+# The weights that make the evaluation the plain stone count.
+def stone_weights():
+    weights = [0.0] * WEIGHTS
+    for c in range(LINES):
+        for t in range(LINE):
+            digits = [(t // 3 ** k) % 3 for k in range(5)]
+            weights[c * LINE + t] = (digits.count(1) - digits.count(2)) / 2
+    return weights
+
+# Makes the lookup table of a line, indexed by its row code, from its
+# base 3 weights.
+def line_table(weights):
+    lookup = [0.0] * 1024
+    for own in range(32):
+        for opp in range(32):
+            if not own & opp:
+                lookup[own << 5 | opp] = weights[TERNARY[own] + 2 * TERNARY[opp]]
+    return lookup
+
+def corner_table(weights):
+    lookup = [0.0] * 256
+    for code in range(256):
+        t = corner_pattern(code)
+        if t is not None:
+            lookup[code] = weights[t]
+    return lookup
+
+# The row and column codes of a position, rows first.
+def line_codes(own, opp):
+    codes = [(own >> (i * 5) & 31) << 5 | (opp >> (i * 5) & 31)
+             for i in range(5)]
+    for i in range(5):
+        o = (((own >> i) & COL_0) * COLUMN_MAGIC >> 20) & 31
+        p = (((opp >> i) & COL_0) * COLUMN_MAGIC >> 20) & 31
+        codes.append(o << 5 | p)
+    return codes
+
+class Patterns(object):
+
+    # Build the lookup tables for a list of WEIGHTS weights, or for the
+    # stone count.
+    def __init__(self, weights = None):
+        if weights is None:
+            weights = stone_weights()
+        self.weights = list(weights)
+        self.tables = [line_table(self.weights[c * LINE:(c + 1) * LINE])
+                       for c in range(LINES)]
+        self.corner = corner_table(self.weights[CORNER_BASE:LIBERTIES])
+        self.liberties = self.weights[LIBERTIES]
+        self.eyes = self.weights[EYES]
+
+    # Only the weights are pickled for worker processes; the lookup
+    # tables are built again from them.
+    def __getstate__(self):
+        return self.weights
+
+    def __setstate__(self, weights):
+        self.__init__(weights)
+
+    # Value of the board for the side to move, in stones. Written out
+    # line by line since it runs at every leaf.
+    def evaluate(self, board):
+        own, opp = board.masks()
+        edge, second, middle = self.tables
+        r0 = (own & 31) << 5 | (opp & 31)
+        r1 = (own >> 5 & 31) << 5 | (opp >> 5 & 31)
+        r2 = (own >> 10 & 31) << 5 | (opp >> 10 & 31)
+        r3 = (own >> 15 & 31) << 5 | (opp >> 15 & 31)
+        r4 = (own >> 20 & 31) << 5 | (opp >> 20 & 31)
+        c0 = ((own & COL_0) * COLUMN_MAGIC >> 20 & 31) << 5 | \
+            ((opp & COL_0) * COLUMN_MAGIC >> 20 & 31)
+        c1 = ((own >> 1 & COL_0) * COLUMN_MAGIC >> 20 & 31) << 5 | \
+            ((opp >> 1 & COL_0) * COLUMN_MAGIC >> 20 & 31)
+        c2 = ((own >> 2 & COL_0) * COLUMN_MAGIC >> 20 & 31) << 5 | \
+            ((opp >> 2 & COL_0) * COLUMN_MAGIC >> 20 & 31)
+        c3 = ((own >> 3 & COL_0) * COLUMN_MAGIC >> 20 & 31) << 5 | \
+            ((opp >> 3 & COL_0) * COLUMN_MAGIC >> 20 & 31)
+        c4 = ((own >> 4 & COL_0) * COLUMN_MAGIC >> 20 & 31) << 5 | \
+            ((opp >> 4 & COL_0) * COLUMN_MAGIC >> 20 & 31)
+        left, right = HALF
+        corner = self.corner
+        value = (edge[r0] + edge[r4] + edge[c0] + edge[c4] +
+                 second[r1] + second[r3] + second[c1] + second[c3] +
+                 middle[r2] + middle[c2] +
+                 corner[left[r0] | left[r1] << 4] +
+                 corner[right[r0] | right[r1] << 4] +
+                 corner[left[r4] | left[r3] << 4] +
+                 corner[right[r4] | right[r3] << 4])
+        empty = FULL & ~(own | opp)
+        near_own = expand(own) & empty
+        near_opp = expand(opp) & empty
+        value += self.liberties * (near_own.bit_count() - near_opp.bit_count())
+        value += self.eyes * ((empty & ~expand(FULL & ~own)).bit_count() -
+                              (empty & ~expand(FULL & ~opp)).bit_count())
+        return round(value)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            array.array("f", self.weights).tofile(f)
+
+# Loaded pattern files by path, so searches in the same process share
+# them.
+loaded = {}
+
+def load(path):
+    if path not in loaded:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{}: not a pattern file".format(path))
+            weights = array.array("f")
+            weights.frombytes(f.read())
+        if len(weights) != WEIGHTS:
+            raise ValueError("{}: wrong number of weights".format(path))
+        loaded[path] = Patterns(weights)
+    return loaded[path]
+
+# The weights a position uses, as (index, value) pairs, for the own
+# and opponent stones of the side to move.
+def features(own, opp):
+    codes = line_codes(own, opp)
+    result = [(LINE_CLASS[i % 5] * LINE +
+               LINE_KEY[TERNARY[code >> 5] + 2 * TERNARY[code & 31]], 1.0)
+              for i, code in enumerate(codes)]
+    for first, second, end in CORNERS:
+        code = HALF[end][codes[first]] | HALF[end][codes[second]] << 4
+        result.append((CORNER_BASE + CORNER_KEY[corner_pattern(code)], 1.0))
+    empty = FULL & ~(own | opp)
+    near_own = expand(own) & empty
+    near_opp = expand(opp) & empty
+    result.append((LIBERTIES, float(near_own.bit_count() - near_opp.bit_count())))
+    result.append((EYES, float((empty & ~expand(FULL & ~own)).bit_count() -
+                               (empty & ~expand(FULL & ~opp)).bit_count())))
+    return result
+
+# Turns a game into training positions: the features of every
+# position and the final stone count for its side to move.
+def game_positions(moves, stones):
+    board = bitboard.BitBoard()
+    result = []
+    for move in moves:
+        own, opp = board.masks()
+        margin = stones if board.to_move == PLAYER_BLACK else -stones
+        result.append((features(own, opp), margin))
+        board.make_move(move)
+    return result
+
+# Plays a self-play game at depth, with random moves for the first
+# random_plies plies so the games differ. Returns the moves and the
+# final black minus white stone count.
+def self_play(depth, random_plies, seed):
+    rng = random.Random(seed)
+    board = bitboard.BitBoard()
+    state = search.Search(table.Table(4))
+    moves = []
+    while True:
+        if len(moves) < random_plies:
+            choices = board.genMoves()
+            move = rng.choice(choices) if choices else PASS
+        else:
+            move = state.iterate(board, depth)
+            if move is None:
+                move = PASS
+        if board.try_move(move) == GAME_OVER:
+            break
+        moves.append(move)
+    # try_move leaves the board as it was on the final pass.
+    moves.append(PASS)
+    stones = board.score()
+    return moves, stones
+
+def squared_error(weights, samples):
+    total = 0.0
+    for feats, target in samples:
+        error = target - sum(weights[i] * v for i, v in feats)
+        total += error * error
+    return total / max(len(samples), 1)
+
+# Fits weights to samples by stochastic gradient descent, pulling every
+# weight towards its starting value by decay.
+def fit(weights, samples, epochs, rate, decay, seed):
+    start = list(weights)
+    weights = list(weights)
+    rng = random.Random(seed)
+    samples = list(samples)
+    for epoch in range(epochs):
+        rng.shuffle(samples)
+        for feats, target in samples:
+            error = target - sum(weights[i] * v for i, v in feats)
+            for i, v in feats:
+                weights[i] += rate * (error * v - decay * (weights[i] - start[i]))
+    return expand_weights(weights)
+
+# Copies every shared entry to the patterns that mirror it.
+def expand_weights(weights):
+    weights = list(weights)
+    for c in range(LINES):
+        for t in range(LINE):
+            weights[c * LINE + t] = weights[c * LINE + LINE_KEY[t]]
+    for t in range(CORNER):
+        weights[CORNER_BASE + t] = weights[CORNER_BASE + CORNER_KEY[t]]
+    return weights
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fit pattern evaluation weights from self-play.")
+    parser.add_argument("--games", type=int, default=200,
+                        help="self-play games to play")
+    parser.add_argument("--depth", type=int, default=2,
+                        help="search depth of the self-play games")
+    parser.add_argument("--random", type=int, default=6, metavar="PLIES",
+                        help="random moves at the start of every game")
+    parser.add_argument("--records", nargs="*", default=[], metavar="FILE",
+                        help="also train on gthlog.py game records")
+    parser.add_argument("--start", metavar="FILE",
+                        help="start from these weights instead of the stone count")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=0.0005)
+    parser.add_argument("--decay", type=float, default=0.1,
+                        help="pull of every weight towards its starting value")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes playing games, one per core by default")
+    parser.add_argument("--output", default="patterns.bin", metavar="FILE")
+    args = parser.parse_args()
+
+    start = time.time()
+    games = []
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as pool:
+        for game in pool.map(self_play, [args.depth] * args.games,
+                             [args.random] * args.games, range(args.games)):
+            games.append(game)
+    for path in args.records:
+        games.extend((game.moves, game.stones)
+                     for game in gthlog.read_records(path))
+    print("{} games in {:.1f}s".format(len(games), time.time() - start))
+
+    # Whole games are held out so the test positions are not
+    # neighbours of training ones.
+    random.Random(0).shuffle(games)
+    held_out = len(games) // 10
+    test = [s for moves, stones in games[:held_out]
+            for s in game_positions(moves, stones)]
+    train = [s for moves, stones in games[held_out:]
+             for s in game_positions(moves, stones)]
+    if args.start is None:
+        weights = stone_weights()
+    else:
+        weights = load(args.start).weights
+    print("positions: {} train {} test".format(len(train), len(test)))
+    print("stone count error: train {:.2f} test {:.2f}".format(
+        squared_error(weights, train), squared_error(weights, test)))
+    start = time.time()
+    weights = fit(weights, train, args.epochs, args.rate, args.decay, 0)
+    print("fitted error: train {:.2f} test {:.2f} in {:.1f}s".format(
+        squared_error(weights, train), squared_error(weights, test),
+        time.time() - start))
+    Patterns(weights).save(args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# Iterative deepening driver and the state shared by one search.
+# A Search is passed down through Board.negamax so the nodes, the
+# transposition table and the deadline are all in one place.
+
+import copy
+import threading
+import time
+
+import bitboard
+import board
+import chainboard
+from board import INF
+
+# Board implementations that can be selected by name.
+ENGINES = {
+    "grid": board.Board,
+    "bitboard": bitboard.BitBoard,
+    "chain": chainboard.ChainBoard,
+}
+
+# Deepest iteration tried when searching against the clock.
+MAX_DEPTH = 24
+
+# Plies that have killer move slots.
+MAX_PLY = MAX_DEPTH + 2
+
+# Half width of the aspiration window, in stones, around the value of
+# the last iteration.
+ASPIRATION = 2
+
+# Seconds to spend on a move with clock seconds left and empties empty
+# points. The remaining time is split over the moves we expect to still
+# make, which is about half of the empty points.
+def move_budget(clock, empties):
+    moves_left = empties // 2 + 2
+    return max(0.9 * clock / moves_left - 0.1, 0.05)
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time budget runs out.
+    """
+    pass
+
+class SearchStats(object):
+    """
+    What one move's search did: nodes, quiescence nodes, table probes
+    and hits, cutoffs, aspiration re-searches, the depth reached, the
+    nodes of every completed iteration and the time taken. The
+    counters bumped at every node stay on the Search that is passed
+    down through negamax; iterate copies them here when it finishes.
+    source tells how the move was found: "search", "book", "endgame"
+    or "mcts", which counts its playouts and tree nodes instead.
+    """
+
+    def __init__(self, source = "search"):
+        self.source = source
+        self.move = None
+        self.value = 0
+        self.depth = -1
+        self.nodes = 0
+        self.qnodes = 0
+        self.iterations = []
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.researches = 0
+        self.playouts = 0
+        self.time = 0.0
+
+    def nps(self):
+        return self.nodes / max(self.time, 1e-6)
+
+    def playouts_per_second(self):
+        return self.playouts / max(self.time, 1e-6)
+
+    def tt_hit_rate(self):
+        return self.tt_hits / max(self.tt_probes, 1)
+
+    # Fraction of beta cutoffs caused by the first move searched.
+    def first_cutoff_rate(self):
+        return self.first_cutoffs / max(self.cutoffs, 1)
+
+    # Effective branching factor: the growth in nodes from the second
+    # last completed iteration to the last one.
+    def branching_factor(self):
+        if len(self.iterations) < 2 or not self.iterations[-2]:
+            return 0.0
+        return self.iterations[-1] / self.iterations[-2]
+
+    def as_dict(self):
+        move = self.move
+        if move is not None:
+            move = list(move)
+        return {
+            "source": self.source,
+            "move": move,
+            "value": self.value,
+            "depth": self.depth,
+            "nodes": self.nodes,
+            "qnodes": self.qnodes,
+            "iterations": self.iterations,
+            "time": round(self.time, 6),
+            "nps": round(self.nps()),
+            "tt_probes": self.tt_probes,
+            "tt_hits": self.tt_hits,
+            "tt_hit_rate": round(self.tt_hit_rate(), 4),
+            "cutoffs": self.cutoffs,
+            "first_cutoff_rate": round(self.first_cutoff_rate(), 4),
+            "researches": self.researches,
+            "branching_factor": round(self.branching_factor(), 3),
+            "playouts": self.playouts,
+            "playouts_per_second": round(self.playouts_per_second()),
+        }
+
+class Search(object):
+
+    # Attributes that change how the search runs. Helper searches in
+    # other threads and processes copy them from the main search.
+    OPTIONS = ("symmetry", "pvs", "quiescence", "patterns")
+
+    # Initalize the search state around a transposition table.
+    def __init__(self, table):
+        self.table = table
+        self.nodes = 0
+        self.deadline = None
+        self.depth = -1
+        self.value = 0
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [0] * 25
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.pool = None
+        self.pondered = False
+        self.symmetry = False
+        self.pvs = False
+        self.quiescence = 0
+        self.patterns = None
+        self.qnodes = 0
+        self.qnode_limit = 0
+        self.researches = 0
+        self.stats = SearchStats()
+        self.profiler = None
+
+    def options(self):
+        return dict((name, getattr(self, name)) for name in self.OPTIONS)
+
+    def set_options(self, options):
+        for name, value in options.items():
+            setattr(self, name, value)
+
+    # Records a beta cutoff. The move becomes a killer for its ply and
+    # gains history score.
+    def cutoff(self, move, depth, ply, index):
+        self.cutoffs += 1
+        if index == 0:
+            self.first_cutoffs += 1
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[move[0] * 5 + move[1]] += depth * depth
+
+    # Starts a new generation of table entries, unless pondering
+    # already started the one for this search.
+    def new_search(self):
+        if self.pondered:
+            self.pondered = False
+        else:
+            self.table.new_search()
+
+    # Keeps the symmetric keys of board up to date only while the
+    # symmetry option is on. They are computed from scratch when it
+    # is turned on.
+    def track_symmetry(self, board):
+        if self.symmetry and not board.symmetric:
+            board.sym_hashes = board.compute_sym_hashes()
+        board.symmetric = self.symmetry
+
+    # Raises SearchTimeout once the deadline has passed.
+    def check_time(self):
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+
+    # Iterative deepening over Board.find_best_move, or over the
+    # process pool when one is set. The pool is started before the
+    # first iteration and stopped after the last one. The first
+    # iteration always completes. After that the search stops when an
+    # iteration runs out of time or is unlikely to finish, and the
+    # board is unwound back to the root. Entries stored by earlier
+    # iterations stay in the table for the later ones. Returns the
+    # best move of the last completed iteration and leaves its value
+    # in self.value and the numbers of the search in self.stats. When
+    # profiler is set, a cProfile.Profile, it runs around the search.
+    def iterate(self, board, max_depth, budget = None):
+        if self.profiler is None:
+            return self.deepen(board, max_depth, budget)
+        self.profiler.enable()
+        try:
+            return self.deepen(board, max_depth, budget)
+        finally:
+            self.profiler.disable()
+
+    def deepen(self, board, max_depth, budget):
+        start = time.time()
+        stats = SearchStats()
+        probes = self.table.probes
+        hits = self.table.hits
+        self.nodes = 0
+        self.depth = -1
+        self.deadline = None
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.researches = 0
+        self.qnodes = 0
+        self.new_search()
+        self.track_symmetry(board)
+        for killers in self.killers:
+            killers[0] = killers[1] = None
+        # History is kept for the whole game but older moves count less.
+        for i in range(25):
+            self.history[i] //= 2
+        root = len(board.undo)
+        best_move = None
+        if self.pool is not None:
+            deadline = None if budget is None else start + budget
+            self.pool.start(self, board, max_depth, deadline)
+        try:
+            for depth in range(max_depth + 1):
+                try:
+                    if self.pool is None:
+                        self.search_root(board, depth)
+                    else:
+                        self.pool.find_best_move(self, board, depth)
+                except SearchTimeout:
+                    while len(board.undo) > root:
+                        board.unmake_move()
+                    break
+                best_move = board.best_move
+                self.value = board.best_value
+                self.depth = depth
+                stats.iterations.append(self.nodes - sum(stats.iterations))
+                if budget is None:
+                    continue
+                elapsed = time.time() - start
+                if elapsed > budget / 2:
+                    break
+                self.deadline = start + budget
+        finally:
+            if self.pool is not None:
+                self.nodes += self.pool.stop()
+        self.deadline = None
+        board.best_move = best_move
+        stats.move = best_move
+        stats.value = self.value
+        stats.depth = self.depth
+        stats.nodes = self.nodes
+        stats.qnodes = self.qnodes
+        stats.tt_probes = self.table.probes - probes
+        stats.tt_hits = self.table.hits - hits
+        stats.cutoffs = self.cutoffs
+        stats.first_cutoffs = self.first_cutoffs
+        stats.researches = self.researches
+        stats.time = time.time() - start
+        self.stats = stats
+        return best_move
+
+    # Searches the root to depth. PVS iterations after the first start
+    # with an aspiration window around the value of the last one, and a
+    # side of the window that fails is opened fully and searched again.
+    def search_root(self, board, depth):
+        if not self.pvs or depth == 0:
+            board.find_best_move(self, depth)
+            return
+        a = self.value - ASPIRATION
+        b = self.value + ASPIRATION
+        while True:
+            board.find_best_move(self, depth, a, b)
+            value = board.best_value
+            if value <= a and a > -INF:
+                a = -INF
+            elif value >= b and b < INF:
+                b = INF
+            else:
+                return
+            self.researches += 1
+
+class PonderSearch(Search):
+
+    # Initalize a search that only stops when told to.
+    def __init__(self, table):
+        Search.__init__(self, table)
+        self.stopping = threading.Event()
+
+    # Ponder starts the generation for the search that follows, so the
+    # entries stored here count as that search's own.
+    def new_search(self):
+        pass
+
+    def check_time(self):
+        if self.stopping.is_set():
+            raise SearchTimeout()
+
+class Ponder(object):
+    """
+    Searches on the opponent's time. After we move, a background
+    thread runs iterative deepening on a copy of the board, which
+    covers every reply the opponent can make, and fills the shared
+    transposition table. Its entries belong to the same generation as
+    our next search, so that search does not replace them as stale.
+    The thread stops within 1024 nodes of stop() being called, so it
+    never eats into our own clock.
+    """
+
+    # Start pondering on board with the opponent to move, sharing the
+    # table and options of search_state.
+    def __init__(self, search_state, board, max_depth = MAX_DEPTH):
+        self.search = PonderSearch(search_state.table)
+        self.search.set_options(search_state.options())
+        search_state.table.new_search()
+        search_state.pondered = True
+        self.board = copy.deepcopy(board)
+        self.thread = threading.Thread(
+            target=self.search.iterate,
+            args=(self.board, max_depth),
+            daemon=True,
+        )
+        self.thread.start()
+
+    # Stop pondering and wait for the thread. Returns the nodes searched.
+    def stop(self):
+        self.search.stopping.set()
+        self.thread.join()
+        return self.search.nodes
@@ -0,0 +1,55 @@
+# The 8 symmetries of the 5x5 board: four rotations, each with and
+# without a mirror. PERMS[s][n] is the point that point n moves to under
+# symmetry s and INVERSE[s] undoes it. Symmetry 0 is the identity.
+#
+# A board keeps the Zobrist keys of its 8 symmetric images up to date
+# in sym_hashes while its symmetric flag is set, which the search does
+# when its symmetry option is on. Positions that are the same under
+# symmetry share a canonical key, the smallest of their 8 keys.
+
+TRANSFORMS = [
+    lambda i, j: (i, j),
+    lambda i, j: (j, 4 - i),
+    lambda i, j: (4 - i, 4 - j),
+    lambda i, j: (4 - j, i),
+    lambda i, j: (i, 4 - j),
+    lambda i, j: (j, i),
+    lambda i, j: (4 - i, j),
+    lambda i, j: (4 - j, 4 - i),
+]
+
+PERMS = []
+for transform in TRANSFORMS:
+    perm = []
+    for n in range(25):
+        i, j = transform(n // 5, n % 5)
+        perm.append(i * 5 + j)
+    PERMS.append(perm)
+
+INVERSE = []
+for perm in PERMS:
+    inverse = [0] * 25
+    for n in range(25):
+        inverse[perm[n]] = n
+    INVERSE.append(inverse)
+
+# Moves a move by symmetry s.
+def move_to(s, move):
+    if move is None or move[0] < 0 or s == 0:
+        return move
+    n = PERMS[s][move[0] * 5 + move[1]]
+    return (n // 5, n % 5)
+
+# Moves a move back from symmetry s.
+def move_from(s, move):
+    if move is None or move[0] < 0 or s == 0:
+        return move
+    n = INVERSE[s][move[0] * 5 + move[1]]
+    return (n // 5, n % 5)
+
+# Returns the canonical key of a board and the symmetry that gives it.
+# The keys are computed from scratch unless the board keeps them.
+def canonical(board):
+    keys = board.sym_hashes if board.symmetric else board.compute_sym_hashes()
+    key = min(keys)
+    return key, keys.index(key)
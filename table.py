@@ -1,49 +1,218 @@
 # Class that manages the transposition table.
-# Code adapted from the Wikipedia page for Zobrist hashing.
+# Positions are indexed by the 64 bit Zobrist key that the Board keeps
+# up to date as moves are made and unmade.
 # https://en.wikipedia.org/wiki/Zobrist_hashing
+#
+# The table has a fixed size given in MB. It is stored in two typed
+# arrays, one holding the value, flag, depth, best move and age of each
+# slot packed into a single word and one holding the full key XORed
+# with that word. An entry only verifies when both words were written
+# together, so a torn or half overwritten entry reads as a miss. That
+# lets SharedTable be written by several processes without locks.
+# Slots are grouped in buckets of two: the first slot keeps the
+# deepest entry of the current search and the second is always
+# replaced.
 
-import random
+import array
+from multiprocessing import shared_memory
+
+from board import INF, PASS
+
+# Bytes used by one slot: a key word and a data word.
+SLOT_BYTES = 16
+
+# Slots looked at to estimate how full a shared table is.
+OCCUPANCY_SAMPLE = 4096
+
+# Layout of the data word.
+VALUE_BIAS = 1 << 15
+VALUE_INF = (1 << 15) - 1
+FLAG_SHIFT = 16
+DEPTH_SHIFT = 18
+MOVE_SHIFT = 26
+AGE_SHIFT = 32
+NO_MOVE = 31
+PASS_MOVE = 25
+
+# Packs an entry into a data word.
+def pack(value, flag, depth, move, age):
+    if value == INF:
+        value = VALUE_INF
+    elif value == -INF:
+        value = -VALUE_INF
+    if move is None:
+        move = NO_MOVE
+    elif move == PASS:
+        move = PASS_MOVE
+    else:
+        move = move[0] * 5 + move[1]
+    return ((value + VALUE_BIAS) | (flag << FLAG_SHIFT) |
+            (depth << DEPTH_SHIFT) | (move << MOVE_SHIFT) | (age << AGE_SHIFT))
+
+# Unpacks a data word into an entry.
+def unpack(data):
+    value = (data & 0xFFFF) - VALUE_BIAS
+    if value == VALUE_INF:
+        value = INF
+    elif value == -VALUE_INF:
+        value = -INF
+    move = (data >> MOVE_SHIFT) & 0x1F
+    if move == NO_MOVE:
+        move = None
+    elif move == PASS_MOVE:
+        move = PASS
+    else:
+        move = (move // 5, move % 5)
+    return Entry(value, (data >> FLAG_SHIFT) & 0x3,
+                 (data >> DEPTH_SHIFT) & 0xFF, move)
+
+# Number of slots that fit in size_mb megabytes, a power of two.
+def slot_count(size_mb):
+    slots = 2
+    while slots * 2 * SLOT_BYTES <= size_mb * (1 << 20):
+        slots *= 2
+    return slots
 
 class Table(object):
-    
-    # Create a array of 20 bits for all possible combinations of piece and position.
-    def __init__(self):
-        bit_table = [[0] * 2 for _ in range(25)]
-        for i in range(25):
-            for j in range(2):
-                bit_table[i][j] = random.getrandbits(20)
-        self.bit_table = bit_table
-        self.table = {}
-
-    # Use the Zobrist hash to get a hash of the board position.
-    def get_hash(self, grid):
-        h = 0
-        count = 0
-        for i in range(5):
-            for j in range(5):
-                if grid[i][j] != 0:
-                    k = grid[i][j] - 1
-                    h = h ^ self.bit_table[count][k]
-                count += 1
-        return h
+
+    # Allocate a table of about size_mb megabytes.
+    def __init__(self, size_mb = 16):
+        slots = slot_count(size_mb)
+        self.setup(array.array('Q', bytes(slots * 8)),
+                   array.array('Q', bytes(slots * 8)))
+        self.age = 0
+
+    # Use keys and data as the slot arrays and reset the counters.
+    def setup(self, keys, data):
+        self.mask = len(keys) // 2 - 1
+        self.keys = keys
+        self.data = data
+        self.used = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0
+
+    # Number of slots in the table.
+    def size(self):
+        return len(self.keys)
+
+    # Start a new search. Entries from older searches are replaced first.
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+
+    # Fraction of slots that hold an entry.
+    def occupancy(self):
+        return self.used / len(self.keys)
 
     # Check to see if a position is in the table.
-    def ttLookup(self, grid):
-        key = self.get_hash(grid)
-        if key in self.table:
-            return self.table[key]
+    def ttLookup(self, key):
+        self.probes += 1
+        slot = (key & self.mask) << 1
+        for s in (slot, slot + 1):
+            data = self.data[s]
+            if data and self.keys[s] ^ data == key:
+                self.hits += 1
+                return unpack(data)
+        return Entry()
+
+    # Store a position indexed by its key.
+    def ttStore(self, key, ttEntry):
+        self.stores += 1
+        slot = (key & self.mask) << 1
+        age = self.age
+        old = self.data[slot]
+        if old and self.keys[slot] ^ old != key and \
+           (old >> DEPTH_SHIFT) & 0xFF > ttEntry.depth and \
+           (old >> AGE_SHIFT) & 0xFF == age:
+            slot += 1
+            old = self.data[slot]
+        if not old:
+            self.used += 1
+        elif self.keys[slot] ^ old != key:
+            self.collisions += 1
+        data = pack(ttEntry.value, ttEntry.flag, ttEntry.depth,
+                    ttEntry.move, age)
+        self.keys[slot] = key ^ data
+        self.data[slot] = data
+
+class SharedTable(Table):
+    """
+    Transposition table in a shared memory block that several
+    processes read and write at once. The block starts with a small
+    header holding the slot count, the age of the current search and
+    a stop flag for helper processes.
+    """
+
+    # Header words.
+    HEADER = 3
+    SLOTS = 0
+    AGE = 1
+    STOP = 2
+
+    # Create a table of about size_mb megabytes, or attach to the
+    # existing block called name.
+    def __init__(self, size_mb = 16, name = None):
+        self.owner = name is None
+        if self.owner:
+            slots = slot_count(size_mb)
+            self.shm = shared_memory.SharedMemory(
+                create=True,
+                size=(self.HEADER + 2 * slots) * 8,
+            )
         else:
-            return Entry()
+            self.shm = shared_memory.SharedMemory(name=name)
+        words = self.shm.buf.cast('Q')
+        self.header = words[:self.HEADER]
+        if self.owner:
+            self.header[self.SLOTS] = slots
+        slots = self.header[self.SLOTS]
+        self.setup(words[self.HEADER:self.HEADER + slots],
+                   words[self.HEADER + slots:self.HEADER + 2 * slots])
+        self.words = words
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def age(self):
+        return self.header[self.AGE]
+
+    @age.setter
+    def age(self, age):
+        self.header[self.AGE] = age
+
+    # Fraction of slots that hold an entry. Other processes fill the
+    # block too, so it is estimated from about OCCUPANCY_SAMPLE evenly
+    # spaced slots rather than a scan of the whole block. The step is
+    # odd so both slots of a bucket are sampled.
+    def occupancy(self):
+        step = len(self.data) // OCCUPANCY_SAMPLE | 1
+        with self.data[::step] as sample:
+            return sum(1 for data in sample if data) / len(sample)
+
+    # Tell helper processes to stop or carry on.
+    def set_stop(self, stop):
+        self.header[self.STOP] = 1 if stop else 0
+
+    def stopped(self):
+        return self.header[self.STOP] != 0
 
-    # Store a position indexed by its hash.
-    def ttStore(self, grid, ttEntry):
-        key = self.get_hash(grid)
-        self.table[key] = ttEntry
+    # Detach from the block, and free it if this process created it.
+    def close(self):
+        for view in (self.keys, self.data, self.header, self.words):
+            view.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
 
 class Entry(object):
+    __slots__ = ("value", "flag", "depth", "move")
 
     # Initalize values for a table entry.
-    def __init__(self, value = 0, flag = 0, depth = -1):
+    def __init__(self, value = 0, flag = 0, depth = -1, move = None):
         self.value = value
         self.flag = flag
         self.depth = depth
+        self.move = move
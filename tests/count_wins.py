@@ -1,6 +1,10 @@
 #!/usr/bin/python3
 
-file = open('results.log', 'r').read()
-print("Black wins:", file.count("Black wins"))
-print("White wins:", file.count("White wins"))
-print("Games drawn:", file.count("Game drawn"))
+wins = {"Black wins": 0, "White wins": 0, "Game drawn": 0}
+with open('results.log', 'r') as file:
+    for line in file:
+        for result in wins:
+            wins[result] += line.count(result)
+print("Black wins:", wins["Black wins"])
+print("White wins:", wins["White wins"])
+print("Games drawn:", wins["Game drawn"])
@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+# Checks the batched NumPy board against the scalar Board. Run with
+# python3 -m pytest tests from the top of the repository.
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch
+import board
+from board import PASS
+
+def test_crosscheck():
+    positions, errors = batch.crosscheck(50, seed=0)
+    assert positions > 0
+    assert errors == 0
+
+def test_pass_leaves_positions():
+    b = board.Board()
+    b.try_move((2, 2))
+    positions, to_move = batch.from_boards([board.Board(), b])
+    after, captured = batch.apply_moves(positions, to_move, PASS)
+    assert np.array_equal(after, positions)
+    assert not captured.any()
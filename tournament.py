@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+# Engine against engine matches played directly through Board, without
+# a server or sockets. Games run in a pool of processes, the two sides
+# swap colors every game and each side has its own engine, search,
+# depth and time settings. A side is given as comma separated
+# settings, for example "engine=chain,depth=4,search=pvs,symmetry" or
+# "time=0.5" to search against a clock of that many seconds per move.
+# "patterns=FILE" evaluates with weights fitted by pattern.py, and
+# "search=mcts,playouts=2000" plays with Monte Carlo tree search.
+#
+# The match reports wins, draws and losses for the first side with its
+# score and Elo difference inside a 95% confidence interval. With
+# --sprt the match stops as soon as a sequential probability ratio test
+# accepts one of two Elo hypotheses.
+
+import argparse
+import concurrent.futures
+import math
+import random
+import time
+
+import mcts
+import pattern
+import search
+import table
+from board import PLAYER_BLACK, PLAYER_WHITE, GAME_OVER, PASS
+
+DEFAULTS = {
+    "engine": "bitboard",
+    "depth": 3,
+    "hash": 16,
+    "time": None,
+    "symmetry": False,
+    "search": "negamax",
+    "quiescence": 0,
+    "patterns": None,
+    "playouts": 5000,
+}
+
+# Turns "engine=chain,depth=4,symmetry" into a settings dict.
+def parse_side(text):
+    settings = dict(DEFAULTS)
+    for item in text.split(","):
+        if not item:
+            continue
+        name, _, value = item.partition("=")
+        if name not in DEFAULTS:
+            raise argparse.ArgumentTypeError("unknown setting: " + name)
+        if name == "engine":
+            if value not in search.ENGINES:
+                raise argparse.ArgumentTypeError("unknown engine: " + value)
+            settings[name] = value
+        elif name == "search":
+            if value not in ("negamax", "pvs", "mcts"):
+                raise argparse.ArgumentTypeError("unknown search: " + value)
+            settings[name] = value
+        elif name == "symmetry":
+            settings[name] = value in ("", "1", "yes", "true")
+        elif name == "time":
+            settings[name] = float(value)
+        elif name == "patterns":
+            settings[name] = value
+        else:
+            settings[name] = int(value)
+    return settings
+
+def describe(settings):
+    text = "{} depth {}".format(settings["engine"], settings["depth"])
+    if settings["search"] == "mcts":
+        text = "{} playouts".format(settings["playouts"])
+    if settings["time"] is not None:
+        text = "{} {}s/move".format(settings["engine"], settings["time"])
+    if settings["search"] != "negamax":
+        text += " " + settings["search"]
+    if settings["quiescence"]:
+        text += " quiescence {}".format(settings["quiescence"])
+    if settings["patterns"] is not None:
+        text += " patterns " + settings["patterns"]
+    if settings["symmetry"]:
+        text += " symmetry"
+    return text
+
+class Side(object):
+
+    # Set up a board and a search for one side of a game.
+    def __init__(self, settings):
+        self.settings = settings
+        self.board = search.ENGINES[settings["engine"]]()
+        self.search = search.Search(table.Table(settings["hash"]))
+        self.search.symmetry = settings["symmetry"]
+        self.search.pvs = settings["search"] == "pvs"
+        self.search.quiescence = settings["quiescence"]
+        if settings["patterns"] is not None:
+            self.search.patterns = pattern.load(settings["patterns"])
+        self.mcts = None
+        if settings["search"] == "mcts":
+            self.mcts = mcts.Mcts(seed=random.random())
+        self.moves = 0
+        self.time = 0.0
+
+    # Searches the current position and returns the move to play.
+    def choose_move(self):
+        start = time.time()
+        budget = self.settings["time"]
+        if self.mcts is not None:
+            move = self.mcts.iterate(self.board, self.settings["playouts"], budget)
+        elif budget is None:
+            move = self.search.iterate(self.board, self.settings["depth"])
+        else:
+            move = self.search.iterate(self.board, search.MAX_DEPTH, budget)
+        self.time += time.time() - start
+        self.moves += 1
+        return move
+
+# Plays one game and returns the first side's score (1, 0.5 or 0) and
+# the (moves, seconds) spent by each side.
+def play_game(first, second, first_black, seed):
+    random.seed(seed)
+    sides = [Side(first), Side(second)]
+    black, white = sides if first_black else sides[::-1]
+    players = {PLAYER_BLACK: black, PLAYER_WHITE: white}
+    while True:
+        move = players[black.board.to_move].choose_move()
+        if move is None:
+            move = PASS
+        if black.board.try_move(move) == GAME_OVER:
+            break
+        white.board.try_move(move)
+    stones = black.board.score()
+    if stones == 0:
+        score = 0.5
+    else:
+        score = 1.0 if (stones > 0) == first_black else 0.0
+    return score, [(side.moves, side.time) for side in sides]
+
+# Score, Elo and the 95% confidence bounds of the Elo for a match.
+def elo_interval(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 +
+                losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return score, elo(score), elo(score - margin), elo(score + margin)
+
+def elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+def expected_score(elo_diff):
+    return 1 / (1 + 10 ** (-elo_diff / 400))
+
+# Log likelihood ratio of elo1 against elo0 for a match, using the
+# normal approximation of the score.
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    games = wins + draws + losses
+    if wins == games or losses == games or draws == games:
+        return 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 +
+                losses * score ** 2) / games
+    s0 = expected_score(elo0)
+    s1 = expected_score(elo1)
+    return games * (s1 - s0) * (2 * score - s0 - s1) / (2 * variance)
+
+# Plays games between first and second in a pool of workers and prints
+# the result. sprt is None or (elo0, elo1, alpha, beta).
+def run(first, second, games, workers, sprt = None):
+    if sprt is not None:
+        elo0, elo1, alpha, beta = sprt
+        lower = math.log(beta / (1 - alpha))
+        upper = math.log((1 - beta) / alpha)
+    results = [0, 0, 0]
+    moves = [0, 0]
+    seconds = [0.0, 0.0]
+    verdict = None
+    start = time.time()
+    pool = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        futures = [pool.submit(play_game, first, second, n % 2 == 0, n)
+                   for n in range(games)]
+        for future in concurrent.futures.as_completed(futures):
+            score, spent = future.result()
+            results[int(2 - 2 * score)] += 1
+            for i in range(2):
+                moves[i] += spent[i][0]
+                seconds[i] += spent[i][1]
+            if sprt is None:
+                continue
+            llr = sprt_llr(*results, elo0, elo1)
+            if llr >= upper:
+                verdict = "H1 accepted (elo >= {})".format(elo1)
+            elif llr <= lower:
+                verdict = "H0 accepted (elo <= {})".format(elo0)
+            if verdict is not None:
+                break
+    finally:
+        pool.shutdown(cancel_futures=True)
+    elapsed = time.time() - start
+    wins, draws, losses = results
+    played = wins + draws + losses
+    score, diff, low, high = elo_interval(wins, draws, losses)
+    print("{} vs {}".format(describe(first), describe(second)))
+    print("games: {} wins: {} draws: {} losses: {}".format(
+        played, wins, draws, losses))
+    print("score: {:.1%} elo: {:+.0f} [{:+.0f}, {:+.0f}]".format(
+        score, diff, low, high))
+    if sprt is not None:
+        print("llr: {:.2f} [{:.2f}, {:.2f}] {}".format(
+            sprt_llr(wins, draws, losses, elo0, elo1), lower, upper,
+            verdict or "inconclusive"))
+    print("games/sec: {:.2f}".format(played / max(elapsed, 1e-6)))
+    for i, side in enumerate((first, second)):
+        print("{}: {:.1f} ms/move".format(
+            describe(side), 1000 * seconds[i] / max(moves[i], 1)))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a Gothello engine match.")
+    parser.add_argument("first", type=parse_side, nargs="?", default=DEFAULTS,
+                        help="settings of the first side")
+    parser.add_argument("second", type=parse_side, nargs="?", default=DEFAULTS,
+                        help="settings of the second side")
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes playing games, one per core by default")
+    parser.add_argument("--sprt", type=float, nargs=4,
+                        metavar=("ELO0", "ELO1", "ALPHA", "BETA"),
+                        help="stop once a sequential test decides between "
+                             "ELO0 and ELO1")
+    args = parser.parse_args()
+    run(args.first, args.second, args.games, args.workers, args.sprt)
+
+if __name__ == "__main__":
+    main()